@@ -1,31 +1,122 @@
-from flask import Flask, render_template_string, request, make_response, redirect, url_for, jsonify
+from flask import Flask, render_template, request, make_response, redirect, url_for, jsonify, Response, stream_with_context, g, has_request_context
+from jinja2 import FileSystemBytecodeCache
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from bs4 import BeautifulSoup
 import threading
 import time
-from datetime import datetime
+from datetime import datetime, timezone
 import uuid
+import random
+import json
+import codecs
+import re
+import zlib
+import gzip
+import sqlite3
+from array import array
+from queue import Queue, Full
 import os
-from functools import wraps
+import sys
+import stat
+from functools import wraps, lru_cache
+from bisect import bisect_left
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor, wait
+from collections import namedtuple, deque
+from types import MappingProxyType
+from urllib.parse import urlsplit
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key')
 
-# Global variables to store data
-agent_data = {
-    'alert_list': [],
-    'aux_list': [],
-    'chat_agents': [],
-    'available_agents': [],
-    'on_call_agents': [],
-    'queue_data': {
+# Static files are cached by browsers for a year, their URLs carry a hash of the content
+STATIC_MAX_AGE = 365 * 24 * 3600
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = STATIC_MAX_AGE
+
+def private_directory(path):
+    """Creates path if missing, True when it is a directory only this user can write to"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    owned = not hasattr(os, 'getuid') or info.st_uid == os.getuid()
+    return stat.S_ISDIR(info.st_mode) and owned and not stat.S_IMODE(info.st_mode) & 0o077
+
+# Compiled templates are kept here across restarts, empty to disable. Unset, Jinja uses its own
+# per-user temp directory. The cache is loaded with marshal, so a directory anyone else can
+# write to is refused
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')
+if TEMPLATE_CACHE_DIR is None:
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+elif TEMPLATE_CACHE_DIR:
+    if private_directory(TEMPLATE_CACHE_DIR):
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+    else:
+        print(f"Not caching compiled templates in {TEMPLATE_CACHE_DIR}, it must be a directory owned by this user with mode 0700")
+
+# Alert thresholds in minutes a tenant starts with, and returns to from the settings page
+DEFAULT_ALERT_TIMES = {
+    "Over Lunch": 60,
+    "Over Break": 15,
+    "Personal": 0,
+    "IT Issues": 0,
+    "Long Call": 7,
+    "ACW": 2,
+    "Unresponsible": 0,
+    "Unavailable": 0
+}
+
+# Read-only view of everything the routes display for one tenant. The updater
+# builds a new one each cycle and publishes it with a single reference swap, so
+# readers always see one consistent generation without taking locks.
+Snapshot = namedtuple('Snapshot', [
+    'generation',
+    'published_at',
+    'agents',
+    'alert_list',
+    'aux_list',
+    'chat_agents',
+    'available_agents',
+    'on_call_agents',
+    'agent_index',
+    'queue_data',
+    'agent_counter_data',
+    'kpi_values',
+    'has_queue_calls',
+    'module_updated_at',
+    'module_expired_at'
+])
+
+# Every tenant starts from this snapshot, and a module's fields are reset to it when its data expires
+EMPTY_SNAPSHOT = Snapshot(
+    generation=0,
+    published_at=time.time(),
+    agents=(),
+    alert_list=(),
+    aux_list=(),
+    chat_agents=(),
+    available_agents=(),
+    on_call_agents=(),
+    agent_index=None,
+    queue_data=MappingProxyType({
         "Contacts in Queue": 0,
         "Longest waiting time": "00:00:00",
         "Callbacks in Queue": 0,
         "Total Agents": 0,
         "Last Update": datetime.now().strftime("%I:%M:%S %p")
-    },
-    'agent_counter_data': {
+    }),
+    agent_counter_data=MappingProxyType({
         "Total Agents": 0,
         "Available": 0,
         "Unavailable": 0,
@@ -36,23 +127,14 @@ agent_data = {
         "Preview": 0,
         "Dialer": 0,
         "Last Update": datetime.now().strftime("%I:%M:%S %p")
-    },
-    'kpi_values': {},
-    'has_queue_calls': False,
-    'token': None,
-    'alert_times': {
-        "Over Lunch": 60,
-        "Over Break": 15,
-        "Personal": 0,
-        "IT Issues": 0,
-        "Long Call": 7,
-        "ACW": 2,
-        "Unresponsible": 0,
-        "Unavailable": 0
-    }
-}
+    }),
+    kpi_values=MappingProxyType({}),
+    has_queue_calls=False,
+    module_updated_at=MappingProxyType({}),
+    module_expired_at=MappingProxyType({})
+)
 
-# API endpoints
+# API endpoints of the default GNC site
 API_ENDPOINTS = {
     'agent_api_url': "https://gnc.adv-reporting.ujet.co/api/v2/dashboards/modules/currentagentstates/4aae9576-e1ab-4b9f-8c6d-ef299e489010",
     'queue_api_url': "https://gnc.adv-reporting.ujet.co/api/v2/dashboards/modules/queueCounter/2ed891eb-e620-41f2-bda5-926f5eea3cf5",
@@ -61,6 +143,229 @@ API_ENDPOINTS = {
     'kpi_data_api_url': "https://gnc.adv-reporting.ujet.co/api/v2/dashboards/modules/metricreview/92ff9406-8be1-4889-9ac5-32201a39b7ae"
 }
 
+# Sites monitored by this process. TENANTS_FILE points to a JSON list of objects with
+# "id", "name" and "endpoints" (same keys as API_ENDPOINTS), and optionally "token",
+# "alert_times" (alerts left out keep their default) and "kpi_mapping"; without it only the
+# GNC site above is monitored.
+TENANTS_FILE = os.environ.get('TENANTS_FILE')
+TENANT_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# Cookie remembering which tenant a browser is looking at
+TENANT_COOKIE = 'tenant'
+
+# Query parameters for each dashboard module fetched every cycle
+MODULE_PARAMS = {
+    'agent_api_url': {
+        "isAutoRefresh": "false",
+        "isFirstLoad": "true",
+        "isCxOne": "false",
+        "useMetrics": "false"
+    },
+    'queue_api_url': {
+        "isAutoRefresh": "true",
+        "isFirstLoad": "true"
+    },
+    'agent_counter_api_url': {
+        "isAutoRefresh": "false",
+        "isFirstLoad": "true"
+    },
+    'kpi_data_api_url': {
+        "isAutoRefresh": "true",
+        "isFirstLoad": "false"
+    }
+}
+
+# Base refresh interval per module, in seconds
+POLL_INTERVALS = {
+    'agent_api_url': float(os.environ.get('POLL_AGENT_INTERVAL', 10)),
+    'queue_api_url': float(os.environ.get('POLL_QUEUE_INTERVAL', 10)),
+    'agent_counter_api_url': float(os.environ.get('POLL_COUNTER_INTERVAL', 10)),
+    'kpi_data_api_url': float(os.environ.get('POLL_KPI_INTERVAL', 60))
+}
+
+# Queue polling: fast while calls wait, backing off up to the max while the queue is empty
+QUEUE_BUSY_INTERVAL = float(os.environ.get('POLL_QUEUE_BUSY_INTERVAL', 3))
+QUEUE_IDLE_BACKOFF = 1.5
+QUEUE_IDLE_MAX_INTERVAL = float(os.environ.get('POLL_QUEUE_IDLE_MAX', 30))
+
+# Random +/- fraction applied to every interval so polls don't line up
+POLL_JITTER = 0.1
+
+# Per-endpoint backoff after a failure (doubling from base up to max), and the circuit
+# breaker that stops calling an endpoint after repeated failures
+BACKOFF_BASE = 5
+BACKOFF_MAX = 60
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', 3))
+BREAKER_COOLDOWN = float(os.environ.get('BREAKER_COOLDOWN', 30))
+BREAKER_MAX_COOLDOWN = float(os.environ.get('BREAKER_MAX_COOLDOWN', 600))
+
+# Module data counts as stale once it is this many of its longest poll intervals old
+STALE_AFTER_INTERVALS = 3
+
+# Last known good module data is kept through failed fetches, and dropped once it is this old (seconds)
+MODULE_MAX_AGE = float(os.environ.get('MODULE_MAX_AGE', 300))
+
+# Snapshot fields filled by each module, reset when its data expires
+MODULE_FIELDS = {
+    'agent_api_url': ('agents', 'alert_list', 'aux_list', 'chat_agents', 'available_agents', 'on_call_agents', 'agent_index'),
+    'queue_api_url': ('queue_data', 'has_queue_calls'),
+    'agent_counter_api_url': ('agent_counter_data',),
+    'kpi_data_api_url': ('kpi_values',)
+}
+FIELD_MODULES = {field: key for key, fields in MODULE_FIELDS.items() for field in fields}
+
+# Seconds an update cycle waits for its modules before publishing what came back
+FETCH_CYCLE_DEADLINE = float(os.environ.get('FETCH_CYCLE_DEADLINE', 12))
+
+# Update cycles running at once across all tenants (each tenant has at most one in flight)
+UPDATE_WORKERS = int(os.environ.get('UPDATE_WORKERS', 4))
+
+# Worker pool shared by the module fetches of all tenants
+FETCH_WORKERS = UPDATE_WORKERS * len(MODULE_PARAMS)
+fetch_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='ujet-fetch')
+
+# HTTP session settings for the UJET API. Every fetch worker may hold a connection to the
+# same host, a smaller pool would discard the extra connections after each use
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', FETCH_WORKERS))
+if HTTP_POOL_SIZE < FETCH_WORKERS:
+    print(f"HTTP_POOL_SIZE {HTTP_POOL_SIZE} is below the {FETCH_WORKERS} fetch workers, using {FETCH_WORKERS}")
+    HTTP_POOL_SIZE = FETCH_WORKERS
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', 2))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 15))
+
+# Parse the currentagentstates payload row by row as it downloads instead of decoding it whole
+AGENT_STREAM_PARSE = os.environ.get('AGENT_STREAM_PARSE', '1') != '0'
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Connection reuse counters, shared by all fetch threads
+connection_stats = {
+    'requests': 0,
+    'new_connections': 0
+}
+connection_stats_lock = threading.Lock()
+
+# Alert rules in priority order: (alert, alert_times key, DisplayState substrings, alert at exactly the threshold)
+ALERT_RULES = [
+    ("Over Lunch", "Over Lunch", ("Meal",), False),
+    ("Over Break", "Over Break", ("Break",), False),
+    ("Personal", "Personal", ("Personal",), True),
+    ("IT Issues", "IT Issues", ("IT",), True),
+    ("Long Call", "Long Call", ("In-call", "On Call"), False),
+    ("ACW", "ACW", ("ACW",), False),
+    ("Unresponsive", "Unresponsible", ("Unresponsive",), False),
+    ("Unavailable", "Unavailable", ("Unavailable",), False)
+]
+
+# States that are not listed as AUX
+NON_AUX_STATES = frozenset(["Available", "On Call", "Chat", "In-call"])
+
+# Alert names in priority order, and array codes for the agent list buckets
+ALERT_NAMES = [rule[0] for rule in ALERT_RULES]
+BUCKET_CODES = {None: 0, 'chat': 1, 'available': 2, 'on_call': 3}
+NO_ALERT = 2 ** 62
+
+# Agent classification backend: 'loop', 'numpy', or 'auto' to use NumPy for large payloads.
+# On compact AgentRows the loop is faster at every size measured, so it is the default.
+CLASSIFIER_BACKEND = os.environ.get('CLASSIFIER_BACKEND', 'loop').lower()
+VECTORIZE_MIN_ROWS = int(os.environ.get('VECTORIZE_MIN_ROWS', 2000))
+
+# Duration parsing cache size and malformed value reporting
+DURATION_CACHE_SIZE = int(os.environ.get('DURATION_CACHE_SIZE', 16384))
+MAX_BAD_DURATION_SAMPLES = 50
+duration_stats = {
+    'malformed': 0,
+    'samples': {}
+}
+duration_stats_lock = threading.Lock()
+
+# Agent lists sent in deltas, rows are matched by agent name
+DELTA_LISTS = ('alert_list', 'aux_list', 'chat_agents', 'available_agents', 'on_call_agents')
+
+# Lists /api/agents can query, the whole table being 'agents'
+AGENT_QUERY_LISTS = ('agents',) + DELTA_LISTS
+
+# Page size of /api/agents by default and at most
+AGENT_PAGE_LIMIT = 50
+MAX_AGENT_PAGE_LIMIT = 500
+
+# StartTime formats tried, in order, when sorting agents by start time
+START_TIME_FORMATS = ('%I:%M %p', '%I:%M:%S %p', '%H:%M:%S', '%H:%M', '%Y-%m-%dT%H:%M:%S', '%m/%d/%Y %I:%M:%S %p')
+
+# Generations of deltas kept for /api/data/delta before clients get a full resync
+DELTA_HISTORY = int(os.environ.get('DELTA_HISTORY', 30))
+
+# Distinguishes ETags across restarts, when generations start again from 0
+BOOT_ID = uuid.uuid4().hex[:8]
+
+# Metric history window and the update interval it is sampled at, in seconds
+HISTORY_WINDOW = int(os.environ.get('HISTORY_WINDOW', 24 * 3600))
+HISTORY_RESOLUTION = 10
+NAN = float('nan')
+
+# Metrics recorded each cycle: history name -> (snapshot field, key)
+HISTORY_METRICS = {
+    'contacts_in_queue': ('queue_data', "Contacts in Queue"),
+    'longest_wait_seconds': ('queue_data', "Longest waiting time"),
+    'callbacks_in_queue': ('queue_data', "Callbacks in Queue"),
+    'queue_total_agents': ('queue_data', "Total Agents"),
+    'agents_total': ('agent_counter_data', "Total Agents"),
+    'agents_available': ('agent_counter_data', "Available"),
+    'agents_unavailable': ('agent_counter_data', "Unavailable"),
+    'agents_inbound': ('agent_counter_data', "Inbound"),
+    'agents_outbound': ('agent_counter_data', "Outbound"),
+    'agents_acw': ('agent_counter_data', "Acw"),
+    'agents_waiting': ('agent_counter_data', "Waiting"),
+    'agents_preview': ('agent_counter_data', "Preview"),
+    'agents_dialer': ('agent_counter_data', "Dialer")
+}
+
+# SQLite history database, disabled when HISTORY_DB is set to an empty string
+HISTORY_DB = os.environ.get('HISTORY_DB', 'history.sqlite3')
+HISTORY_QUEUE_SIZE = 60
+
+# Rollup tables (name -> bucket seconds), from finest to coarsest, and how long each level is kept
+ROLLUP_RESOLUTIONS = {
+    '1m': 60,
+    '15m': 900
+}
+HISTORY_RETENTION = {
+    'raw': int(os.environ.get('HISTORY_RAW_DAYS', 2)) * 86400,
+    '1m': int(os.environ.get('HISTORY_1M_DAYS', 30)) * 86400,
+    '15m': int(os.environ.get('HISTORY_15M_DAYS', 400)) * 86400
+}
+
+# Seconds between keep-alive comments on idle /stream connections
+SSE_KEEPALIVE = 15
+
+# Response compression: encodings offered in order of preference (br only with the brotli
+# package installed), bodies smaller than the minimum are sent as they are. Levels are low
+# because bodies change every generation: delta bodies reach megabytes on large floors and
+# gzip -6 costs about five times gzip -1 for a quarter less output
+COMPRESS_ENCODINGS = ['br', 'gzip'] if brotli else ['gzip']
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 1))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 4))
+
+# Upper bounds in seconds of the timing histograms served at /metrics
+TIMING_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Timing histograms served at /metrics: name -> (help text, label names)
+TIMING_METRICS = {
+    'sla_monitor_fetch_seconds': ("Time to fetch a dashboard module, from request to decoded body", ('tenant', 'module')),
+    'sla_monitor_decode_seconds': ("Time to decode a module body (reading and parsing the body for the streamed agent module)", ('tenant', 'module')),
+    'sla_monitor_stage_seconds': ("Time spent in an update cycle stage after the fetches", ('tenant', 'stage')),
+    'sla_monitor_cycle_seconds': ("Wall time of an update cycle", ('tenant',)),
+    'sla_monitor_route_seconds': ("Time to handle and render a request, by Flask endpoint", ('endpoint',))
+}
+
+# Sampling profiler: seconds to profile from startup (0 = off), time between samples,
+# longest window a run may last and most distinct stacks kept per run
+PROFILE_ON_START = float(os.environ.get('PROFILE_ON_START', 0))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.01))
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', 300))
+PROFILE_MAX_STACKS = 20000
+
 # KPI mapping
 KPI_MAPPING = {
     7398: "SLA % - Call",
@@ -74,162 +379,1197 @@ KPI_MAPPING = {
     134099: "Missed Calls"
 }
 
+# HTTP session
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    """Connection pool that counts every new connection it opens"""
+    def _new_conn(self):
+        with connection_stats_lock:
+            connection_stats['new_connections'] += 1
+        return super()._new_conn()
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    """HTTPS connection pool that counts every new connection (TLS handshake) it opens"""
+    def _new_conn(self):
+        with connection_stats_lock:
+            connection_stats['new_connections'] += 1
+        return super()._new_conn()
+
+class PooledAdapter(HTTPAdapter):
+    """Keep-alive adapter whose pools report new connections to connection_stats"""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool
+        }
+
+def create_http_session():
+    """Builds the shared keep-alive session used for all UJET API calls"""
+    retries = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False
+    )
+    adapter = PooledAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=retries
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+http_session = create_http_session()
+
+def http_get(url, headers, params=None, stream=False):
+    """GET through the shared session with split connect/read timeouts"""
+    with connection_stats_lock:
+        connection_stats['requests'] += 1
+    return http_session.get(
+        url,
+        headers=headers,
+        params=params,
+        timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+        stream=stream
+    )
+
+def get_connection_stats():
+    """Returns request, new connection and reused connection counts"""
+    with connection_stats_lock:
+        stats = dict(connection_stats)
+    stats['reused_connections'] = max(stats['requests'] - stats['new_connections'], 0)
+    return stats
+
 # Helper functions
+def parse_duration(time_str):
+    """Converts an HH:MM:SS (or HHH:MM:SS for 100+ hours) string to seconds.
+    
+    Values that are not in that form are reported through report_bad_duration
+    and count as 0 seconds.
+    """
+    if type(time_str) is str:
+        # Fast path for the fixed-width HH:MM:SS the API normally sends
+        if len(time_str) == 8 and time_str[2] == ':' and time_str[5] == ':':
+            try:
+                return int(time_str[0:2]) * 3600 + int(time_str[3:5]) * 60 + int(time_str[6:8])
+            except ValueError:
+                pass
+        parts = time_str.split(':')
+        if len(parts) == 3:
+            try:
+                h, m, s = map(int, parts)
+                return h * 3600 + m * 60 + s
+            except ValueError:
+                pass
+    report_bad_duration(time_str)
+    return 0
+
+# Durations repeat heavily across agents and cycles, so parsed values are memoized
+_cached_parse_duration = lru_cache(maxsize=DURATION_CACHE_SIZE)(parse_duration)
+
 def time_to_seconds(time_str):
     """Converts HH:MM:SS time string to seconds"""
     try:
-        h, m, s = map(int, time_str.split(':'))
-        return h * 3600 + m * 60 + s
-    except (ValueError, AttributeError):
-        return 0
+        return _cached_parse_duration(time_str)
+    except TypeError:
+        # Unhashable value, nothing to cache
+        return parse_duration(time_str)
 
-def fetch_data(url, headers, params=None):
-    """Generic function to fetch data from API"""
-    try:
-        response = requests.get(
-            url,
-            headers=headers,
-            params=params,
-            timeout=15
+def report_bad_duration(time_str):
+    """Counts a duration that could not be parsed and logs the first few distinct ones.
+    
+    Cached values are only reported the first time they are parsed.
+    """
+    with duration_stats_lock:
+        duration_stats['malformed'] += 1
+        value = repr(time_str)[:40]
+        if value in duration_stats['samples'] or len(duration_stats['samples']) >= MAX_BAD_DURATION_SAMPLES:
+            return
+        duration_stats['samples'][value] = datetime.now().strftime("%I:%M:%S %p")
+    print(f"Could not parse agent duration {value}, counting it as 0 seconds")
+
+def get_duration_stats():
+    """Returns the malformed duration count and samples, and the parse cache counters.
+    
+    Only parses are counted, so a malformed value that stays cached counts once
+    however many agents and cycles carry it.
+    """
+    with duration_stats_lock:
+        stats = {'malformed': duration_stats['malformed'], 'samples': dict(duration_stats['samples'])}
+    cache = _cached_parse_duration.cache_info()
+    stats['cache'] = {'hits': cache.hits, 'misses': cache.misses, 'size': cache.currsize, 'max_size': cache.maxsize}
+    return stats
+
+# State classification
+StateRule = namedtuple('StateRule', ['alerts', 'is_aux', 'bucket'])
+
+class StateClassifier:
+    """Compiles alert_times and the state patterns into a per-DisplayState lookup table.
+    
+    Each distinct DisplayState is matched against the patterns once and cached as a
+    StateRule holding its alert candidates (alert name, minimum seconds) in priority
+    order, whether it is an AUX state and which agent list it belongs to.
+    """
+    MAX_CACHED_STATES = 4096
+    
+    def __init__(self, alert_times):
+        self.alert_times = dict(alert_times)
+        self.rules = {}
+        self.thresholds = []
+        for alert, setting, patterns, inclusive in ALERT_RULES:
+            # Durations are whole seconds, so "> t" is the same as ">= t + 1"
+            min_seconds = self.alert_times.get(setting, 0) * 60
+            if not inclusive:
+                min_seconds += 1
+            self.thresholds.append((alert, patterns, min_seconds))
+    
+    def compile(self, state):
+        """Builds and caches the rule for one DisplayState"""
+        alerts = tuple(
+            (alert, min_seconds)
+            for alert, patterns, min_seconds in self.thresholds
+            if any(pattern in state for pattern in patterns)
         )
         
+        if "Chat" in state:
+            bucket = 'chat'
+        elif state == "Available":
+            bucket = 'available'
+        elif state == "On Call" or state == "In-call":
+            bucket = 'on_call'
+        else:
+            bucket = None
+        
+        rule = StateRule(alerts, state not in NON_AUX_STATES, bucket)
+        if len(self.rules) >= self.MAX_CACHED_STATES:
+            self.rules.clear()
+        self.rules[state] = rule
+        return rule
+    
+    def classify(self, state):
+        """Returns the cached rule for a DisplayState"""
+        rule = self.rules.get(state)
+        if rule is None:
+            rule = self.compile(state)
+        return rule
+
+def fetch_data(url, headers, params=None, timings=None):
+    """Generic function to fetch data from API, putting the JSON decode time in timings['decode'] if given"""
+    try:
+        response = http_get(url, headers, params=params)
+        
         if response.status_code == 200:
+            decode_start = time.perf_counter()
             data = response.json()
+            if timings is not None:
+                timings['decode'] = time.perf_counter() - decode_start
             if data.get('status', '').lower() != 'success':
                 raise ValueError(f"API returned unsuccessful status: {data.get('message', 'Unknown error')}")
             return data
         else:
             raise requests.exceptions.HTTPError(f"HTTP Error {response.status_code}: {response.text}")
-            
+    
     except Exception as e:
         print(f"Error fetching data from {url}: {str(e)}")
         return None
 
-def get_headers(token):
-    """Returns headers with the given token"""
-    return {
+# One agent as every list, template and API sees it: the four currentagentstates fields the
+# dashboard uses (everything else in a row is dropped) and the alert raised for it, if any
+AgentRow = namedtuple('AgentRow', ['name', 'duration', 'state', 'start_time', 'alert'], defaults=('',))
+
+def intern_text(value):
+    """Interned copy of a row's text field, with null and other non-string values read as Unknown"""
+    return sys.intern(value) if isinstance(value, str) else "Unknown"
+
+def nested_field(agent, key, field):
+    """agent[key][field], None when agent[key] is missing, null or not an object"""
+    container = agent.get(key)
+    return container.get(field) if isinstance(container, dict) else None
+
+def agent_row(agent):
+    """Extracts the fields the dashboard uses from one RowValues entry, None if the entry is not an object"""
+    if not isinstance(agent, dict):
+        return None
+    # Names, states and start times repeat across agents and cycles, interning keeps one copy of each
+    return AgentRow(
+        intern_text(nested_field(agent, "Group", "groupName")),
+        agent.get("Duration", "00:00:00"),
+        intern_text(nested_field(agent, "State", "DisplayState")),
+        intern_text(agent.get("StartTime", "Unknown"))
+    )
+
+def agent_rows(entries):
+    """AgentRows of RowValues entries, skipping (and reporting) entries that are not objects"""
+    rows = []
+    skipped = 0
+    for entry in entries:
+        row = agent_row(entry)
+        if row is None:
+            skipped += 1
+        else:
+            rows.append(row)
+    if skipped:
+        print(f"Skipped {skipped} agent rows that are not objects")
+    return rows
+
+class AgentView:
+    """Read-only list of AgentRows, stored as row indexes into one cycle's agent table.
+    
+    The alert, aux, chat, available and on-call lists are views into the same
+    table, so an agent that appears in several of them is stored once.
+    """
+    
+    __slots__ = ('table', 'indexes')
+    
+    def __init__(self, table, indexes):
+        self.table = table
+        self.indexes = indexes
+    
+    def __len__(self):
+        return len(self.indexes)
+    
+    def __iter__(self):
+        return map(self.table.__getitem__, self.indexes)
+    
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return AgentView(self.table, self.indexes[position])
+        return self.table[self.indexes[position]]
+    
+    def __eq__(self, other):
+        if isinstance(other, AgentView):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+    
+    def __repr__(self):
+        return f"AgentView({list(self)!r})"
+
+@lru_cache(maxsize=DURATION_CACHE_SIZE)
+def start_time_key(start_time):
+    """Sort key of a StartTime value, unparseable ones sorting after every time"""
+    for time_format in START_TIME_FORMATS:
+        try:
+            return (0, datetime.strptime(start_time, time_format))
+        except (TypeError, ValueError):
+            continue
+    return (1, datetime.min)
+
+def rank_array(order):
+    """Inverse of a sort order: position of each row in it"""
+    ranks = array('i', bytes(len(order) * array('i').itemsize))
+    for position, index in enumerate(order):
+        ranks[index] = position
+    return ranks
+
+class AgentIndex:
+    """Lookups over one cycle's agent table, built once when the agent module is processed.
+    
+    Holds the rows of each state and alert type in table order, the rows
+    sorted by duration and by start time with every row's rank in those
+    orders, and the lowercased names in sorted order for prefix search, so
+    queries filter, sort and page without scanning or sorting the table.
+    """
+    
+    __slots__ = ('table', 'by_state', 'by_alert', 'orders', 'ranks', 'names', 'name_rows')
+    
+    def __init__(self, table):
+        self.table = table
+        self.by_state = {}
+        self.by_alert = {}
+        seconds = []
+        for index, (name, duration, state, _, alert) in enumerate(table):
+            rows = self.by_state.get(state)
+            if rows is None:
+                rows = self.by_state[state] = array('i')
+            rows.append(index)
+            if alert:
+                rows = self.by_alert.get(alert)
+                if rows is None:
+                    rows = self.by_alert[alert] = array('i')
+                rows.append(index)
+            seconds.append(time_to_seconds(duration))
+        
+        start_keys = [start_time_key(row.start_time) for row in table]
+        self.orders = {
+            'duration': array('i', sorted(range(len(table)), key=seconds.__getitem__)),
+            'start_time': array('i', sorted(range(len(table)), key=start_keys.__getitem__))
+        }
+        self.ranks = {sort: rank_array(order) for sort, order in self.orders.items()}
+        names = sorted((row.name.lower(), index) for index, row in enumerate(table))
+        self.names = [name for name, _ in names]
+        self.name_rows = array('i', [index for _, index in names])
+    
+    def name_prefix_rows(self, prefix):
+        """Rows whose name starts with prefix, ignoring case"""
+        prefix = prefix.lower()
+        start = bisect_left(self.names, prefix)
+        end = start
+        while end < len(self.names) and self.names[end].startswith(prefix):
+            end += 1
+        return self.name_rows[start:end]
+    
+    def groups(self, field, view):
+        """Rows of a view grouped by 'state' or 'alert', groups in the order they first appear in the view"""
+        lookup = self.by_state if field == 'state' else self.by_alert
+        members = set(view.indexes)
+        groups = []
+        for key, rows in lookup.items():
+            selected = array('i', [index for index in rows if index in members])
+            if selected:
+                groups.append((selected[0], key, AgentView(self.table, selected)))
+        return {key: rows for _, key, rows in sorted(groups, key=itemgetter(0))}
+    
+    def query(self, view=None, states=(), alerts=(), name_prefix='', sort=None, descending=False):
+        """Returns the row indexes matching every filter given, in sort order (table order without one)"""
+        selections = []
+        if view is not None:
+            selections.append(view.indexes)
+        if states:
+            selections.append([index for state in states for index in self.by_state.get(state, ())])
+        if alerts:
+            selections.append([index for alert in alerts for index in self.by_alert.get(alert, ())])
+        if name_prefix:
+            selections.append(self.name_prefix_rows(name_prefix))
+        
+        if not selections:
+            # Nothing to filter, the precomputed order is the answer
+            if sort is None:
+                return range(len(self.table))
+            order = self.orders[sort]
+            return order[::-1] if descending else order
+        
+        # Intersect starting from the smallest selection
+        selections.sort(key=len)
+        rows = set(selections[0])
+        for selection in selections[1:]:
+            rows.intersection_update(selection)
+        if sort is None:
+            return sorted(rows)
+        return sorted(rows, key=self.ranks[sort].__getitem__, reverse=descending)
+
+class JSONStreamReader:
+    """Walks a JSON document arriving in text chunks, decoding one value at a time.
+    
+    Only the part of the document not yet consumed is buffered. Array items
+    are decoded one at a time and values the caller skips are scanned without
+    decoding, so neither is held all at once; a value that is decoded is
+    buffered whole.
+    """
+    
+    WHITESPACE = re.compile(r'[ \t\n\r]*')
+    # Text between brackets, strings included
+    SKIPPABLE = re.compile(r'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*', re.DOTALL)
+    # Characters a number can continue with in the next chunk
+    NUMBER_TAIL = re.compile(r'[-+.eE0-9]*')
+    
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.exhausted = False
+    
+    def _fill(self, min_chars=1):
+        """Appends chunks to the buffer until at least min_chars were added, returning False at the end of the stream"""
+        pending = []
+        size = 0
+        for chunk in self.chunks:
+            pending.append(chunk)
+            size += len(chunk)
+            if size >= max(min_chars, 1):
+                break
+        else:
+            self.exhausted = True
+        if not size:
+            return False
+        self.buffer = self.buffer[self.pos:] + ''.join(pending)
+        self.pos = 0
+        return True
+    
+    def _next_char(self):
+        """Skips whitespace and returns the next character without consuming it ('' at the end)"""
+        while True:
+            self.pos = self.WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+    
+    def peek(self):
+        return self._next_char()
+    
+    def expect(self, char):
+        """Consumes the given structural character"""
+        found = self._next_char()
+        if found != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}, found {found or 'end of data'!r}")
+        self.pos += 1
+    
+    def value(self):
+        """Decodes the next complete JSON value"""
+        self._next_char()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number at the very end of the buffer may continue in the next chunk
+                if self.exhausted or not isinstance(value, (int, float)) or self.NUMBER_TAIL.match(self.buffer, end).end() < len(self.buffer):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            # Read at least as much again as is buffered, so a value spanning many chunks
+            # is decoded a logarithmic number of times instead of once per chunk
+            self._fill(len(self.buffer) - self.pos)
+    
+    def skip(self):
+        """Consumes the next JSON value, scanning objects and arrays without decoding (or validating) them"""
+        if self._next_char() not in ('{', '['):
+            self.value()
+            return
+        depth = 0
+        while True:
+            buffer = self.buffer
+            pos = self.pos
+            while True:
+                # Runs up to the next bracket, or to a string that ends in a later chunk
+                pos = self.SKIPPABLE.match(buffer, pos).end()
+                if pos == len(buffer) or buffer[pos] == '"':
+                    break
+                depth += 1 if buffer[pos] in '[{' else -1
+                pos += 1
+                if not depth:
+                    self.pos = pos
+                    return
+            # Everything scanned so far is dropped by the next fill
+            self.pos = pos
+            if not self._fill(len(buffer) - pos):
+                raise ValueError("Unterminated value at end of data")
+    
+    def object_keys(self):
+        """Yields the keys of the object just opened; the caller consumes each value"""
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError(f"Expected an object key at offset {self.pos}")
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+    
+    def array_items(self):
+        """Yields each value of the array just opened"""
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
+
+def parse_agent_states(chunks):
+    """Parses a currentagentstates response from text chunks, keeping only AgentRow fields.
+    
+    Returns the payload in the shape of response.json(), with data.RowValues holding
+    AgentRows and the other data keys left out.
+    """
+    reader = JSONStreamReader(chunks)
+    payload = {}
+    reader.expect('{')
+    for key in reader.object_keys():
+        if key != 'data' or reader.peek() != '{':
+            payload[key] = reader.value()
+            continue
+        reader.expect('{')
+        payload['data'] = {}
+        for data_key in reader.object_keys():
+            if data_key == 'RowValues' and reader.peek() == '[':
+                reader.expect('[')
+                payload['data']['RowValues'] = agent_rows(reader.array_items())
+            else:
+                reader.skip()
+    if reader.peek():
+        raise ValueError(f"Extra data at offset {reader.pos}")
+    return payload
+
+def response_text_chunks(response):
+    """Decodes a streamed response body into text chunks (JSON defaults to UTF-8)"""
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+def fetch_agent_states(url, headers, params=None, timings=None):
+    """Fetches the currentagentstates module, parsing RowValues as they download (read and parse time in timings['decode'])"""
+    try:
+        response = http_get(url, headers, params=params, stream=True)
+        try:
+            if response.status_code == 200:
+                decode_start = time.perf_counter()
+                data = parse_agent_states(response_text_chunks(response))
+                if timings is not None:
+                    timings['decode'] = time.perf_counter() - decode_start
+                if str(data.get('status', '')).lower() != 'success':
+                    raise ValueError(f"API returned unsuccessful status: {data.get('message', 'Unknown error')}")
+                return data
+            else:
+                raise requests.exceptions.HTTPError(f"HTTP Error {response.status_code}: {response.text}")
+        finally:
+            response.close()
+    
+    except Exception as e:
+        print(f"Error fetching data from {url}: {str(e)}")
+        return None
+
+# Headers per (token, site origin), reused until the token changes
+_headers_cache = {}
+MAX_CACHED_HEADERS = 64
+
+def get_headers(token, origin="https://gnc.adv-reporting.ujet.co"):
+    """Returns headers with the given token for a site, building them once per token"""
+    headers = _headers_cache.get((token, origin))
+    if headers is not None:
+        return headers
+    headers = {
         "X-ACCESS-TOKEN": token,
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36",
         "Accept": "*/*",
-        "Referer": "https://gnc.adv-reporting.ujet.co/Dashboard/DashboardNew.aspx"
+        "Referer": f"{origin}/Dashboard/DashboardNew.aspx"
     }
+    if len(_headers_cache) >= MAX_CACHED_HEADERS:
+        _headers_cache.clear()
+    _headers_cache[(token, origin)] = headers
+    return headers
+
+class PageCache:
+    """Rendered pages (or compressed bodies) per key and snapshot generation.
+    
+    Entries for older generations are dropped as soon as a newer one is
+    requested, and concurrent misses on the same key render only once.
+    """
+    def __init__(self):
+        self.generation = None
+        self.pages = {}
+        self.render_locks = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get_or_render(self, key, generation, render):
+        """Returns the cached page for key, rendering it on the first request of a generation"""
+        with self.lock:
+            if generation != self.generation:
+                if self.generation is not None and generation < self.generation:
+                    # Request pinned to an older snapshot than the cache, don't evict
+                    self.misses += 1
+                    return render()
+                self.generation = generation
+                self.pages = {}
+                self.render_locks = {}
+            page = self.pages.get(key)
+            if page is not None:
+                self.hits += 1
+                return page
+            render_lock = self.render_locks.setdefault(key, threading.Lock())
+        
+        with render_lock:
+            page = self.pages.get(key)
+            if page is not None:
+                with self.lock:
+                    self.hits += 1
+                return page
+            page = render()
+            with self.lock:
+                self.misses += 1
+                if generation == self.generation:
+                    self.pages[key] = page
+        return page
+    
+    def stats(self):
+        """Returns hit and miss counts"""
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'cached_pages': len(self.pages),
+                'generation': self.generation
+            }
+
+def cached_page(*query_args):
+    """Decorator rendering a route at most once per snapshot generation and set of query_args"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            snapshot = get_snapshot()
+            key = (f.__name__, tuple(request.args.get(arg) for arg in query_args))
+            return current_tenant().page_cache.get_or_render(key, snapshot.generation, lambda: f(*args, **kwargs))
+        return decorated_function
+    return decorator
+
+def generation_etag(snapshot):
+    """Strong ETag for the current tenant, route, query string and snapshot generation"""
+    tag = f"{BOOT_ID}-{current_tenant().id}-{request.endpoint}-{snapshot.generation}"
+    if request.query_string:
+        tag += '-' + format(zlib.crc32(request.query_string), '08x')
+    return tag
+
+def conditional_on_generation(f):
+    """Decorator adding a generation ETag and Last-Modified, answering 304 when the client is current"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        snapshot = get_snapshot()
+        etag = generation_etag(snapshot)
+        # A compressed body has its own ETag, either one is current for this generation
+        encoding = accepted_encoding()
+        current_etags = [etag, f"{etag}-{encoding}"] if encoding else [etag]
+        matched = next((tag for tag in current_etags if request.if_none_match.contains(tag)), None)
+        if matched:
+            response = make_response('', 304)
+            response.set_etag(matched)
+        else:
+            response = make_response(f(*args, **kwargs))
+            response.set_etag(etag)
+            compress_response(response, snapshot.generation)
+        response.last_modified = datetime.fromtimestamp(int(snapshot.published_at), timezone.utc)
+        response.cache_control.no_cache = True
+        # The tenant can come from the cookie, the encoding from Accept-Encoding
+        response.vary.add('Cookie')
+        response.vary.add('Accept-Encoding')
+        return response.make_conditional(request)
+    return decorated_function
+
+# Responses and bytes seen by compress_response, across tenants
+compression_stats = {
+    'responses': 0,
+    'compressed': 0,
+    'too_small': 0,
+    'identity_bytes': 0,
+    'sent_bytes': 0
+}
+compression_stats_lock = threading.Lock()
+
+def accepted_encoding():
+    """Returns the client's preferred encoding out of COMPRESS_ENCODINGS, or None to send the body as is"""
+    return request.accept_encodings.best_match(COMPRESS_ENCODINGS)
+
+def compress_body(body, encoding):
+    """Returns body compressed with encoding"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+def compress_response(response, generation):
+    """Compresses a response for the current tenant's snapshot generation, once per path, query and encoding.
+    
+    The compressed body is cached by generation like rendered pages, so every
+    client of a generation shares one compression. An ETag gets the encoding
+    appended, since the compressed body is a different representation.
+    """
+    if response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = accepted_encoding()
+    body = response.get_data()
+    compressed = None
+    if encoding and len(body) >= COMPRESS_MIN_SIZE:
+        key = (request.path, request.query_string, encoding)
+        compressed = current_tenant().compressed_cache.get_or_render(key, generation, lambda: compress_body(body, encoding))
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak)
+    with compression_stats_lock:
+        compression_stats['responses'] += 1
+        compression_stats['identity_bytes'] += len(body)
+        if compressed is None:
+            compression_stats['sent_bytes'] += len(body)
+            if encoding:
+                compression_stats['too_small'] += 1
+        else:
+            compression_stats['sent_bytes'] += len(compressed)
+            compression_stats['compressed'] += 1
+    return response
+
+def compression_summary():
+    """Compression counters and the overall ratio of bytes sent to bytes before compression"""
+    with compression_stats_lock:
+        summary = dict(compression_stats)
+    summary['ratio'] = round(summary['sent_bytes'] / summary['identity_bytes'], 3) if summary['identity_bytes'] else None
+    summary['encodings'] = COMPRESS_ENCODINGS
+    summary['min_size'] = COMPRESS_MIN_SIZE
+    return summary
 
 def token_required(f):
     """Decorator to check if token is set"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not agent_data['token']:
+        if not current_tenant().agent_data['token']:
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
 
-def update_agent_data():
-    """Updates all agent data from APIs"""
-    if not agent_data['token']:
-        return
+class CircuitBreaker:
+    """Health of one UJET endpoint, with exponential backoff and a circuit breaker.
     
-    headers = get_headers(agent_data['token'])
-    
-    # Fetch agent data
-    agent_api_data = fetch_data(
-        API_ENDPOINTS['agent_api_url'],
-        headers,
-        params={
-            "isAutoRefresh": "false",
-            "isFirstLoad": "true",
-            "isCxOne": "false",
-            "useMetrics": "false"
+    closed: calls are allowed, each consecutive failure doubles the wait
+    before the next attempt. open: after BREAKER_FAILURE_THRESHOLD
+    consecutive failures no calls are made until the cooldown passes, and
+    the cooldown doubles every time the circuit re-opens. half_open: one
+    probe call is let through; success closes the circuit, failure opens it
+    again.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.state = 'closed'
+        self.failures = 0
+        self.opened = 0
+        self.retry_at = 0.0
+        self.last_success = None
+        self.last_failure = None
+        self.lock = threading.Lock()
+    
+    def allow(self, now):
+        """Whether a call may be made now"""
+        with self.lock:
+            if now < self.retry_at:
+                return False
+            if self.state == 'open':
+                self.state = 'half_open'
+                print(f"Circuit for {self.name} half-open, sending a probe")
+            return True
+    
+    def record_success(self, now):
+        """Closes the circuit and resets the backoff"""
+        with self.lock:
+            if self.state != 'closed':
+                print(f"Circuit for {self.name} closed")
+            self.state = 'closed'
+            self.failures = 0
+            self.opened = 0
+            self.retry_at = 0.0
+            self.last_success = now
+    
+    def record_failure(self, now):
+        """Backs off, opening the circuit after too many consecutive failures"""
+        with self.lock:
+            self.failures += 1
+            self.last_failure = now
+            if self.state == 'half_open' or self.failures >= BREAKER_FAILURE_THRESHOLD:
+                self.opened += 1
+                self.state = 'open'
+                cooldown = min(BREAKER_COOLDOWN * 2 ** (self.opened - 1), BREAKER_MAX_COOLDOWN)
+                print(f"Circuit for {self.name} open for {cooldown:.0f}s after {self.failures} failures")
+            else:
+                cooldown = min(BACKOFF_BASE * 2 ** (self.failures - 1), BACKOFF_MAX)
+            self.retry_at = now + cooldown
+    
+    def retry_in(self, now):
+        """Seconds until the next call is allowed"""
+        return max(self.retry_at - now, 0.0)
+    
+    def status(self, now):
+        """Returns the breaker state for reporting"""
+        with self.lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'retry_in': round(max(self.retry_at - now, 0.0), 1),
+                'last_success': self.last_success,
+                'last_failure': self.last_failure
+            }
+
+def module_health(tenant, snapshot, now):
+    """Per module: age of the last good data, when expired data was last good, whether it is stale, and the circuit state"""
+    health = {}
+    thresholds = stale_thresholds()
+    for key in MODULE_PARAMS:
+        updated_at = snapshot.module_updated_at.get(key)
+        age = now - updated_at if updated_at is not None else None
+        breaker = tenant.breakers[key].status(now)
+        health[key] = {
+            'age': round(age, 1) if age is not None else None,
+            'no_data_since': snapshot.module_expired_at.get(key),
+            'stale': age is None or age > thresholds[key] or breaker['state'] != 'closed',
+            'circuit': breaker
         }
-    )
+    return health
+
+def timed_fetch(tenant, key, headers):
+    """Fetches a single dashboard module of a tenant and returns (data, latency in seconds)"""
+    start = time.perf_counter()
+    fetch = fetch_agent_states if key == 'agent_api_url' and AGENT_STREAM_PARSE else fetch_data
+    timings = {}
+    data = fetch(tenant.endpoints[key], headers, params=MODULE_PARAMS[key], timings=timings)
+    latency = time.perf_counter() - start
+    timing_metrics.observe('sla_monitor_fetch_seconds', (tenant.id, key), latency)
+    if 'decode' in timings:
+        timing_metrics.observe('sla_monitor_decode_seconds', (tenant.id, key), timings['decode'])
+    return data, latency
+
+def record_fetch_metric(fetch_metrics, key, latency=None, ok=False, timed_out=False):
+    """Records latency and outcome of one endpoint fetch"""
+    stats = fetch_metrics['endpoints'].setdefault(key, {
+        'count': 0,
+        'errors': 0,
+        'timeouts': 0,
+        'last_latency': None,
+        'avg_latency': None,
+        'max_latency': None
+    })
+    stats['count'] += 1
+    if timed_out:
+        stats['timeouts'] += 1
+        return
+    if not ok:
+        stats['errors'] += 1
+    stats['last_latency'] = round(latency, 4)
+    if stats['avg_latency'] is None:
+        stats['avg_latency'] = stats['last_latency']
+    else:
+        stats['avg_latency'] = round(stats['avg_latency'] * 0.8 + latency * 0.2, 4)
+    stats['max_latency'] = max(stats['max_latency'] or 0, stats['last_latency'])
+
+class TimingHistogram:
+    """Durations in seconds counted into TIMING_BUCKETS, plus their sum and the last one.
     
-    # Clear lists
-    agent_data['alert_list'] = []
-    agent_data['aux_list'] = []
-    agent_data['chat_agents'] = []
-    agent_data['available_agents'] = []
-    agent_data['on_call_agents'] = []
+    Recording is a bisect and a few additions under a lock, cheap enough to run
+    for every fetch, cycle stage and request.
+    """
+    __slots__ = ('lock', 'counts', 'total', 'count', 'last')
     
-    # Process agent data
-    if agent_api_data and "data" in agent_api_data and "RowValues" in agent_api_data["data"]:
-        agents = agent_api_data["data"]["RowValues"]
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(TIMING_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.last = None
+    
+    def observe(self, seconds):
+        """Records one duration"""
+        index = bisect_left(TIMING_BUCKETS, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += seconds
+            self.count += 1
+            self.last = seconds
+    
+    def read(self):
+        """Returns (cumulative bucket counts, sum, count)"""
+        with self.lock:
+            counts, total, count = list(self.counts), self.total, self.count
+        cumulative = []
+        running = 0
+        for bucket_count in counts:
+            running += bucket_count
+            cumulative.append(running)
+        return cumulative, total, count
+
+class TimingMetrics:
+    """The TIMING_METRICS histograms, one per metric and tuple of label values"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {name: {} for name in TIMING_METRICS}
+    
+    def observe(self, name, labels, seconds):
+        """Records a duration for a metric and its label values, in TIMING_METRICS order"""
+        histogram = self.histograms[name].get(labels)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms[name].setdefault(labels, TimingHistogram())
+        histogram.observe(seconds)
+    
+    def last(self, name, labels):
+        """Returns the last duration recorded for a metric and label values, or None"""
+        histogram = self.histograms[name].get(labels)
+        return histogram.last if histogram else None
+    
+    def prometheus_lines(self):
+        """Yields every histogram in the Prometheus text format"""
+        for name, (help_text, label_names) in TIMING_METRICS.items():
+            with self.lock:
+                histograms = sorted(self.histograms[name].items())
+            yield f"# HELP {name} {help_text}"
+            yield f"# TYPE {name} histogram"
+            for labels, histogram in histograms:
+                pairs = list(zip(label_names, labels))
+                cumulative, total, count = histogram.read()
+                for bound, bucket_count in zip(TIMING_BUCKETS + ('+Inf',), cumulative):
+                    yield f"{name}_bucket{prometheus_labels(pairs + [('le', bound)])} {bucket_count}"
+                yield f"{name}_sum{prometheus_labels(pairs)} {total:.6f}"
+                yield f"{name}_count{prometheus_labels(pairs)} {count}"
+
+timing_metrics = TimingMetrics()
+
+def prometheus_labels(pairs):
+    """Formats (name, value) pairs as a Prometheus label set"""
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def prometheus_metric(name, metric_type, help_text, samples):
+    """Returns the lines of a counter or gauge from (label pairs, value) samples, skipping None values"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for pairs, value in samples:
+        if isinstance(value, float):
+            value = round(value, 6)
+        if value is not None:
+            lines.append(f"{name}{prometheus_labels(pairs)} {value}")
+    return lines
+
+def fetch_modules(tenant, headers, modules=None, deadline=None):
+    """Fetches a tenant's dashboard modules (default all) concurrently and returns the ones that came back before the deadline"""
+    if modules is None:
+        modules = MODULE_PARAMS
+    if deadline is None:
+        deadline = FETCH_CYCLE_DEADLINE
+    breakers = tenant.breakers
+    fetch_metrics = tenant.fetch_metrics
+    cycle_start = time.perf_counter()
+    now = time.time()
+    # Endpoints backing off or with an open circuit are skipped, their last good data stays
+    modules = [key for key in modules if breakers[key].allow(now)]
+    futures = {fetch_executor.submit(timed_fetch, tenant, key, headers): key for key in modules}
+    done, not_done = wait(futures, timeout=deadline)
+    
+    results = {}
+    serial_time = 0.0
+    now = time.time()
+    for future in done:
+        key = futures[future]
+        data, latency = future.result()
+        record_fetch_metric(fetch_metrics, key, latency, ok=data is not None)
+        if data is None:
+            breakers[key].record_failure(now)
+        else:
+            breakers[key].record_success(now)
+        serial_time += latency
+        results[key] = data
+    
+    for future in not_done:
+        key = futures[future]
+        record_fetch_metric(fetch_metrics, key, timed_out=True)
+        breakers[key].record_failure(now)
+        print(f"Fetch of {tenant.id}/{key} missed the {deadline}s cycle deadline, keeping previous data")
+    
+    fetch_metrics['cycles'] += 1
+    fetch_metrics['last_cycle_time'] = round(time.perf_counter() - cycle_start, 4)
+    # What the same fetches would have cost one after another
+    fetch_metrics['last_cycle_serial_time'] = round(serial_time, 4)
+    return results
+
+def agent_views(table, alert_rows, aux_rows, chat_rows, available_rows, on_call_rows):
+    """Returns the agent table and the dashboard lists as views into it"""
+    return {
+        'agents': table,
+        'alert_list': AgentView(table, alert_rows),
+        'aux_list': AgentView(table, aux_rows),
+        'chat_agents': AgentView(table, chat_rows),
+        'available_agents': AgentView(table, available_rows),
+        'on_call_agents': AgentView(table, on_call_rows)
+    }
+
+def classify_agents_loop(agents, classifier):
+    """Classifies AgentRows one agent at a time"""
+    table = list(agents)
+    alert_rows = []
+    aux_rows = []
+    bucket_rows = {
+        'chat': [],
+        'available': [],
+        'on_call': []
+    }
+    
+    for index, (name, duration, state, start_time, _) in enumerate(table):
+        rule = classifier.classify(state)
         
-        for agent in agents:
-            name = agent.get("Group", {}).get("groupName", "Unknown")
-            duration = agent.get("Duration", "00:00:00")
-            state = agent.get("State", {}).get("DisplayState", "Unknown")
-            start_time = agent.get("StartTime", "Unknown")
-            
-            # Convert duration to seconds
+        # Alert detection, the duration is only parsed for states that can alert
+        if rule.alerts:
             duration_sec = time_to_seconds(duration)
-            
-            # Alert detection
-            alert = ""
-            if "Meal" in state and duration_sec > (agent_data['alert_times']["Over Lunch"] * 60):
-                alert = "Over Lunch"
-            elif "Break" in state and duration_sec > (agent_data['alert_times']["Over Break"] * 60):
-                alert = "Over Break"
-            elif "Personal" in state and duration_sec >= (agent_data['alert_times']["Personal"] * 60):
-                alert = "Personal"
-            elif "IT" in state and duration_sec >= (agent_data['alert_times']["IT Issues"] * 60):
-                alert = "IT Issues"
-            elif ("In-call" in state or "On Call" in state) and duration_sec > (agent_data['alert_times']["Long Call"] * 60):
-                alert = "Long Call"
-            elif "ACW" in state and duration_sec > (agent_data['alert_times']["ACW"] * 60):
-                alert = "ACW"
-            elif "Unresponsive" in state and duration_sec > (agent_data['alert_times']["Unresponsive"] * 60):
-                alert = "Unresponsive"
-            elif "Unavailable" in state and duration_sec > (agent_data['alert_times']["Unavailable"] * 60):
-                alert = "Unavailable"
-            
-            if alert:
-                agent_data['alert_list'].append((alert, name, duration, state))
-            
-            # Agents in AUX states
-            if state not in ["Available", "On Call", "Chat", "In-call"]:
-                agent_data['aux_list'].append((state, name, duration, start_time))
-            
-            # Separate agents in chats, available and in calls
-            if "Chat" in state:
-                agent_data['chat_agents'].append((name, state, duration, start_time))
-            elif state == "Available":
-                agent_data['available_agents'].append((name, state, duration, start_time))
-            elif state == "On Call" or state == "In-call":
-                agent_data['on_call_agents'].append((name, state, duration, start_time))
-    
-    # Fetch queue data
-    queue_info = fetch_data(
-        API_ENDPOINTS['queue_api_url'],
-        headers,
-        params={
-            "isAutoRefresh": "true",
-            "isFirstLoad": "true"
-        }
+            for alert, min_seconds in rule.alerts:
+                if duration_sec >= min_seconds:
+                    table[index] = AgentRow(name, duration, state, start_time, alert)
+                    alert_rows.append(index)
+                    break
+        
+        # Agents in AUX states
+        if rule.is_aux:
+            aux_rows.append(index)
+        
+        # Separate agents in chats, available and in calls
+        if rule.bucket:
+            bucket_rows[rule.bucket].append(index)
+    
+    return agent_views(
+        tuple(table),
+        array('i', alert_rows),
+        array('i', aux_rows),
+        array('i', bucket_rows['chat']),
+        array('i', bucket_rows['available']),
+        array('i', bucket_rows['on_call'])
+    )
+
+def durations_to_seconds(durations):
+    """Parses fixed-width HH:MM:SS strings column-wise.
+    
+    Returns (seconds, parsed) arrays; rows where parsed is False were not in
+    fixed-width form and still need time_to_seconds.
+    """
+    count = len(durations)
+    seconds = np.zeros(count, dtype=np.int64)
+    parsed = np.zeros(count, dtype=bool)
+    column = np.array(durations, dtype=str)
+    width = column.dtype.itemsize // 4
+    if count == 0 or width < 8:
+        return seconds, parsed
+    
+    # Unicode code points of the first 8 characters, shifted so '0'..'9' are 0..9
+    chars = column.view(np.uint32).reshape(count, width)[:, :8].astype(np.int64) - ord('0')
+    digits = chars[:, [0, 1, 3, 4, 6, 7]]
+    colon = ord(':') - ord('0')
+    parsed = (
+        (np.char.str_len(column) == 8)
+        & (chars[:, 2] == colon)
+        & (chars[:, 5] == colon)
+        & ((digits >= 0) & (digits <= 9)).all(axis=1)
+    )
+    seconds = (
+        (chars[:, 0] * 10 + chars[:, 1]) * 3600
+        + (chars[:, 3] * 10 + chars[:, 4]) * 60
+        + chars[:, 6] * 10 + chars[:, 7]
+    )
+    seconds[~parsed] = 0
+    return seconds, parsed
+
+def index_array(rows):
+    """Converts a NumPy array of row numbers to a compact array('i')"""
+    indexes = array('i')
+    indexes.frombytes(rows.astype(np.intc).tobytes())
+    return indexes
+
+def pick(column, rows):
+    """Returns column[i] for each index in rows as a tuple, gathered in C"""
+    if not rows:
+        return ()
+    if len(rows) == 1:
+        return (column[rows[0]],)
+    return itemgetter(*rows)(column)
+
+def classify_agents_vectorized(agents, classifier):
+    """Classifies AgentRows column-wise with NumPy masks, giving the same lists as classify_agents_loop"""
+    if not agents:
+        return classify_agents_loop(agents, classifier)
+    
+    # Split the payload into parallel columns
+    names, durations, states, start_times, _ = zip(*agents)
+    
+    # Encode states as small integers so rules are looked up once per distinct state
+    state_codes = {state: code for code, state in enumerate(dict.fromkeys(states))}
+    codes = np.fromiter(map(state_codes.__getitem__, states), dtype=np.intp, count=len(states))
+    rules = [classifier.classify(state) for state in state_codes]
+    
+    # Per state code: minimum seconds for each alert rule, NO_ALERT where the rule does not apply
+    min_seconds = np.full((len(rules), len(ALERT_NAMES)), NO_ALERT, dtype=np.int64)
+    for code, rule in enumerate(rules):
+        for alert, seconds in rule.alerts:
+            min_seconds[code, ALERT_NAMES.index(alert)] = seconds
+    state_can_alert = (min_seconds != NO_ALERT).any(axis=1)
+    is_aux = np.array([rule.is_aux for rule in rules], dtype=bool)[codes]
+    buckets = np.array([BUCKET_CODES[rule.bucket] for rule in rules], dtype=np.int8)[codes]
+    
+    # Durations are only parsed for rows whose state can alert, odd values go through time_to_seconds
+    alert_candidates = np.flatnonzero(state_can_alert[codes])
+    candidate_durations = pick(durations, alert_candidates.tolist())
+    duration_sec, parsed = durations_to_seconds(candidate_durations)
+    for i in np.flatnonzero(~parsed).tolist():
+        duration_sec[i] = time_to_seconds(candidate_durations[i])
+    
+    # First rule (in priority order) whose threshold the duration reaches
+    hits = duration_sec[:, None] >= min_seconds[codes[alert_candidates]]
+    has_alert = hits.any(axis=1)
+    alert_rows = alert_candidates[has_alert]
+    alert_names = pick(ALERT_NAMES, hits[has_alert].argmax(axis=1).tolist())
+    
+    # Only the alerting rows are rebuilt, every other row is shared with the payload
+    table = list(agents)
+    for index, alert in zip(alert_rows.tolist(), alert_names):
+        table[index] = table[index]._replace(alert=alert)
+    
+    return agent_views(
+        tuple(table),
+        index_array(alert_rows),
+        index_array(np.flatnonzero(is_aux)),
+        index_array(np.flatnonzero(buckets == BUCKET_CODES['chat'])),
+        index_array(np.flatnonzero(buckets == BUCKET_CODES['available'])),
+        index_array(np.flatnonzero(buckets == BUCKET_CODES['on_call']))
     )
+
+def use_vectorized_classifier(row_count):
+    """Whether a payload of row_count agents goes through the NumPy path"""
+    if np is None or CLASSIFIER_BACKEND == 'loop':
+        return False
+    if CLASSIFIER_BACKEND == 'numpy':
+        return True
+    return row_count >= VECTORIZE_MIN_ROWS
+
+def process_agent_module(agent_api_data, tenant):
+    """Classifies agents from the currentagentstates module into the alert/aux/chat/available/on-call lists"""
+    if agent_api_data and "data" in agent_api_data and "RowValues" in agent_api_data["data"]:
+        agents = agent_api_data["data"]["RowValues"]
+        # The streaming fetch already hands over AgentRows, a full json() decode does not
+        if agents and not isinstance(agents[0], AgentRow):
+            agents = agent_rows(agents)
+        classifier = tenant.state_classifier
+        start = time.perf_counter()
+        if use_vectorized_classifier(len(agents)):
+            views = classify_agents_vectorized(agents, classifier)
+        else:
+            views = classify_agents_loop(agents, classifier)
+        indexed = time.perf_counter()
+        views['agent_index'] = AgentIndex(views['agents'])
+        timing_metrics.observe('sla_monitor_stage_seconds', (tenant.id, 'classify'), indexed - start)
+        timing_metrics.observe('sla_monitor_stage_seconds', (tenant.id, 'index'), time.perf_counter() - indexed)
+        return views
     
+    views = classify_agents_loop([], tenant.state_classifier)
+    views['agent_index'] = AgentIndex(views['agents'])
+    return views
+
+def process_queue_module(queue_info, tenant):
+    """Returns the queueCounter module values"""
     if queue_info and "data" in queue_info:
         queue_info = queue_info["data"]
-        agent_data['queue_data'] = {
+        queue_data = {
             "Contacts in Queue": queue_info.get('BothInQueue', 0),
             "Longest waiting time": queue_info.get('LongestQueueTimeBoth', '00:00:00'),
             "Callbacks in Queue": queue_info.get('CallbacksInQueue', 0),
             "Total Agents": queue_info.get('TotalAgents', 0),
             "Last Update": datetime.now().strftime("%I:%M:%S %p")
         }
-        agent_data['has_queue_calls'] = agent_data['queue_data']['Contacts in Queue'] > 0
-    
-    # Fetch agent counter data
-    agent_counter_info = fetch_data(
-        API_ENDPOINTS['agent_counter_api_url'],
-        headers,
-        params={
-            "isAutoRefresh": "false",
-            "isFirstLoad": "true"
+        return {
+            'queue_data': MappingProxyType(queue_data),
+            'has_queue_calls': queue_data['Contacts in Queue'] > 0
         }
-    )
-    
+    return {}
+
+def process_agent_counter_module(agent_counter_info, tenant):
+    """Returns the agentCounterData module values"""
     if agent_counter_info and "data" in agent_counter_info:
         agent_data_info = agent_counter_info["data"]
-        agent_data['agent_counter_data'] = {
+        return {'agent_counter_data': MappingProxyType({
             "Total Agents": agent_data_info.get('Total', 0),
             "Available": agent_data_info.get('Available', 0),
             "Unavailable": agent_data_info.get('Unavailable', 0),
@@ -240,194 +1580,1125 @@ def update_agent_data():
             "Preview": agent_data_info.get('Preview', 0),
             "Dialer": agent_data_info.get('Dialer', 0),
             "Last Update": datetime.now().strftime("%I:%M:%S %p")
-        }
-    
-    # Fetch KPI data
-    kpi_data = fetch_data(
-        API_ENDPOINTS['kpi_data_api_url'],
-        headers,
-        params={
-            "isAutoRefresh": "true",
-            "isFirstLoad": "false"
-        }
-    )
-    
+        })}
+    return {}
+
+def process_kpi_module(kpi_data, tenant):
+    """Returns the metricreview module values mapped through the tenant's KPI mapping"""
     if kpi_data and "data" in kpi_data:
-        agent_data['kpi_values'] = {}
+        kpi_values = {}
         for metric in kpi_data["data"].get("Metrics", []):
             metric_id = metric.get("Metric", {}).get("MetricID")
             metric_value = metric.get("Today", {}).get("MetricValue")
             metric_display = metric.get("Today", {}).get("MetricDisplayValue")
             
-            if metric_id in KPI_MAPPING:
-                agent_data['kpi_values'][metric_id] = {
-                    "name": KPI_MAPPING[metric_id],
+            if metric_id in tenant.kpi_mapping:
+                kpi_values[metric_id] = MappingProxyType({
+                    "name": tenant.kpi_mapping[metric_id],
                     "value": metric_value,
                     "display": metric_display
-                }
+                })
+        return {'kpi_values': MappingProxyType(kpi_values)}
+    return {}
+
+# Module processors, called with (payload, tenant) in this order for the modules that came back in time
+MODULE_PROCESSORS = [
+    ('agent_api_url', process_agent_module),
+    ('queue_api_url', process_queue_module),
+    ('agent_counter_api_url', process_agent_counter_module),
+    ('kpi_data_api_url', process_kpi_module)
+]
+
+def update_agent_data(tenant, modules=None):
+    """Updates a tenant's data from the given dashboard modules (default all)"""
+    if not tenant.agent_data['token']:
+        return
+    
+    cycle_start = time.perf_counter()
+    headers = get_headers(tenant.agent_data['token'], tenant.origin)
+    
+    # Fetch the modules at once, so the cycle takes as long as the slowest call
+    results = fetch_modules(tenant, headers, modules)
+    
+    # A failed fetch keeps the module's last known good data instead of blanking it
+    changes = {}
+    for key, processor in MODULE_PROCESSORS:
+        if results.get(key) is not None:
+            changes.update(processor(results[key], tenant))
+    
+    # Remember when each module last brought good data, so its age can be shown
+    fetched_at = time.time()
+    module_updated_at = dict(tenant.snapshot.module_updated_at)
+    fetched = [key for key, data in results.items() if data is not None]
+    module_updated_at.update({key: fetched_at for key in fetched})
+    # When each dropped module last had data, so pages say there is none since then
+    module_expired_at = {key: at for key, at in tenant.snapshot.module_expired_at.items() if key not in fetched}
+    # Data older than the maximum age is dropped rather than shown as current
+    for key, updated_at in list(module_updated_at.items()):
+        if fetched_at - updated_at > MODULE_MAX_AGE:
+            print(f"Dropping {tenant.id}/{key} data, last updated {fetched_at - updated_at:.0f}s ago")
+            changes.update({field: getattr(EMPTY_SNAPSHOT, field) for field in MODULE_FIELDS[key]})
+            del module_updated_at[key]
+            module_expired_at[key] = updated_at
+    if module_updated_at != tenant.snapshot.module_updated_at:
+        changes['module_updated_at'] = MappingProxyType(module_updated_at)
+    if module_expired_at != tenant.snapshot.module_expired_at:
+        changes['module_expired_at'] = MappingProxyType(module_expired_at)
+    
+    stage_start = time.perf_counter()
+    snapshot = publish_snapshot(tenant, changes, fetched)
+    timing_metrics.observe('sla_monitor_stage_seconds', (tenant.id, 'publish'), time.perf_counter() - stage_start)
+    
+    stage_start = time.perf_counter()
+    # Agent state changes, only when this cycle brought a fresh agent payload
+    state_changes = []
+    if results.get('agent_api_url') is not None:
+        state_changes = tenant.state_tracker.update(snapshot_agents(snapshot), snapshot.published_at)
+    if tenant.history_store:
+        tenant.history_store.submit(snapshot, state_changes, fetched)
+    now = time.perf_counter()
+    timing_metrics.observe('sla_monitor_stage_seconds', (tenant.id, 'history'), now - stage_start)
+    timing_metrics.observe('sla_monitor_cycle_seconds', (tenant.id,), now - cycle_start)
+
+def module_ages(snapshot):
+    """Age in seconds of each module's data when the snapshot was published (None if there is none)"""
+    ages = {}
+    for key in MODULE_PARAMS:
+        updated_at = snapshot.module_updated_at.get(key)
+        ages[key] = round(snapshot.published_at - updated_at) if updated_at is not None else None
+    return ages
+
+def longest_poll_interval(key):
+    """Longest the scheduler can wait between two fetches of a module, jitter included"""
+    interval = POLL_INTERVALS[key]
+    if key == 'queue_api_url':
+        # An empty queue backs off up to the idle max, a busy one polls at the busy interval
+        interval = max(interval, QUEUE_IDLE_MAX_INTERVAL, QUEUE_BUSY_INTERVAL)
+    return interval * (1 + POLL_JITTER)
+
+def stale_thresholds():
+    """Age in seconds past which each module's data counts as stale"""
+    return {key: longest_poll_interval(key) * STALE_AFTER_INTERVALS for key in MODULE_PARAMS}
+
+def no_data_since(snapshot):
+    """Time each module whose data expired last had data, for the modules that have none now"""
+    return {key: datetime.fromtimestamp(at).strftime("%I:%M:%S %p") for key, at in snapshot.module_expired_at.items()}
+
+def stale_notice(snapshot, *modules):
+    """Returns the age and time of the oldest data a page shows past its stale threshold, or None when all are fresh.
+    
+    A module whose data expired and was cleared takes precedence, with expired set:
+    the page then has no data since that time rather than old data.
+    """
+    expired = [snapshot.module_expired_at[key] for key in modules if key in snapshot.module_expired_at]
+    stale = []
+    thresholds = stale_thresholds()
+    for key in modules:
+        updated_at = snapshot.module_updated_at.get(key)
+        if updated_at is not None and snapshot.published_at - updated_at > thresholds[key]:
+            stale.append(updated_at)
+    if not expired and not stale:
+        return None
+    oldest = min(expired or stale)
+    return {
+        'age': round(snapshot.published_at - oldest),
+        'since': datetime.fromtimestamp(oldest).strftime("%I:%M:%S %p"),
+        'expired': bool(expired)
+    }
+
+def get_snapshot():
+    """Returns the snapshot pinned to the current request, or the current tenant's latest one"""
+    if has_request_context():
+        snapshot = g.get('snapshot')
+        if snapshot is None:
+            snapshot = g.snapshot = current_tenant().snapshot
+        return snapshot
+    return current_tenant().snapshot
+
+def publish_snapshot(tenant, changes, fetched=()):
+    """Publishes a new snapshot generation for a tenant, keeping unchanged fields from the previous one.
+    
+    Only the metrics of the fetched modules are sampled into the metric history,
+    the others still hold data from an earlier cycle.
+    """
+    with tenant.snapshot_published:
+        previous = tenant.snapshot
+        snapshot = previous._replace(
+            generation=previous.generation + 1,
+            published_at=time.time(),
+            **changes
+        )
+        # History is extended before the swap, so it always covers the published generation
+        tenant.delta_history = tenant.delta_history[-(DELTA_HISTORY - 1):] + (snapshot_delta(previous, snapshot),)
+        # Likewise the metric history, /api/trends responses are cached per generation.
+        # Fast queue polling can publish more often than the history resolution, values
+        # fetched within it go into the newest sample
+        metrics = snapshot_metrics(snapshot, fetched)
+        if metrics:
+            if snapshot.published_at - tenant.metric_history.last_timestamp() >= HISTORY_RESOLUTION * 0.8:
+                tenant.metric_history.append(snapshot.published_at, metrics)
+            else:
+                tenant.metric_history.update_latest(metrics)
+        tenant.snapshot = snapshot
+        tenant.snapshot_published.notify_all()
+    return snapshot
+
+def list_delta(old_rows, new_rows):
+    """Returns rows that entered or changed and names that left between two agent lists.
+    
+    Rows that entered come with their position in the new list, so clients can keep
+    the list in order. The whole name order is only sent when rows that stayed moved.
+    """
+    old = {row.name: row for row in old_rows}
+    new = {row.name: row for row in new_rows}
+    changes = {
+        'upsert': [list(row) for name, row in new.items() if old.get(name) != row],
+        'remove': [name for name in old if name not in new],
+        'insert_at': {name: position for position, name in enumerate(new) if name not in old}
+    }
+    if [name for name in new if name in old] != [name for name in old if name in new]:
+        changes['order'] = list(new)
+    return changes
+
+def dict_delta(old, new):
+    """Returns keys whose value changed, with None for keys that were removed"""
+    changed = {key: value for key, value in new.items() if old.get(key) != value}
+    changed.update({key: None for key in old if key not in new})
+    return changed
+
+def snapshot_delta(previous, snapshot):
+    """Computes what changed from one snapshot generation to the next"""
+    lists = {}
+    for list_name in DELTA_LISTS:
+        old_rows = getattr(previous, list_name)
+        new_rows = getattr(snapshot, list_name)
+        if old_rows is new_rows:
+            continue
+        changes = list_delta(old_rows, new_rows)
+        if changes['upsert'] or changes['remove'] or 'order' in changes:
+            lists[list_name] = changes
+    
+    fields = {}
+    for field in ('queue_data', 'agent_counter_data', 'module_updated_at', 'module_expired_at'):
+        changes = dict_delta(getattr(previous, field), getattr(snapshot, field))
+        if changes:
+            fields[field] = changes
+    kpi_changes = dict_delta(previous.kpi_values, snapshot.kpi_values)
+    if kpi_changes:
+        fields['kpi_values'] = {
+            str(metric_id): dict(kpi) if kpi is not None else None
+            for metric_id, kpi in kpi_changes.items()
+        }
+    if previous.has_queue_calls != snapshot.has_queue_calls:
+        fields['has_queue_calls'] = snapshot.has_queue_calls
+    
+    return {
+        'generation': snapshot.generation,
+        'published_at': snapshot.published_at,
+        'lists': lists,
+        'fields': fields
+    }
+
+def delta_response_body(tenant, snapshot, since):
+    """Returns the encoded /api/data/delta body taking a client of a tenant from generation since to snapshot"""
+    history = tenant.delta_history
+    
+    cached_generation, bodies = tenant.delta_response_cache
+    if cached_generation != snapshot.generation:
+        bodies = {}
+        tenant.delta_response_cache = (snapshot.generation, bodies)
+    
+    deltas = [delta for delta in history if delta['generation'] <= snapshot.generation]
+    oldest = deltas[0]['generation'] if deltas else snapshot.generation + 1
+    if since is None or since > snapshot.generation or since < oldest - 1:
+        # Unknown or too far behind, resync with the full snapshot
+        since = 'full'
+    
+    body = bodies.get(since)
+    if body is None:
+        if since == 'full':
+            data = {
+                'generation': snapshot.generation,
+                'full': True,
+                'snapshot': snapshot_to_dict(snapshot)
+            }
+        else:
+            data = {
+                'generation': snapshot.generation,
+                'full': False,
+                'deltas': [delta for delta in deltas if delta['generation'] > since]
+            }
+        body = json.dumps(data, separators=(',', ':'))
+        bodies[since] = body
+    return body
+
+def wait_for_snapshot(tenant, last_generation, timeout):
+    """Blocks until a tenant publishes a snapshot newer than last_generation or the timeout passes"""
+    with tenant.snapshot_published:
+        tenant.snapshot_published.wait_for(lambda: tenant.snapshot.generation != last_generation, timeout)
+    return tenant.snapshot
+
+def snapshot_to_dict(snapshot):
+    """Converts a snapshot to plain JSON-serializable structures"""
+    return {
+        'generation': snapshot.generation,
+        'agent_fields': AgentRow._fields,
+        'alert_list': [list(row) for row in snapshot.alert_list],
+        'aux_list': [list(row) for row in snapshot.aux_list],
+        'chat_agents': [list(row) for row in snapshot.chat_agents],
+        'available_agents': [list(row) for row in snapshot.available_agents],
+        'on_call_agents': [list(row) for row in snapshot.on_call_agents],
+        'queue_data': dict(snapshot.queue_data),
+        'agent_counter_data': dict(snapshot.agent_counter_data),
+        'kpi_values': {str(metric_id): dict(kpi) for metric_id, kpi in snapshot.kpi_values.items()},
+        'has_queue_calls': snapshot.has_queue_calls,
+        'module_updated_at': dict(snapshot.module_updated_at),
+        'module_age': module_ages(snapshot),
+        'module_expired_at': dict(snapshot.module_expired_at),
+        'published_at': snapshot.published_at
+    }
+
+def snapshot_sse_message(tenant, snapshot, since):
+    """Returns the SSE message taking a stream from generation since to snapshot.
+    
+    The body is the /api/data/delta one, so it is encoded once per generation for
+    all streams: the full snapshot when the stream has none yet (or is too far
+    behind), otherwise the deltas, which hold only what changed.
+    """
+    return f"id: {snapshot.generation}\nevent: delta\ndata: {delta_response_body(tenant, snapshot, since)}\n\n"
+
+# Metric history
+class MetricHistory:
+    """Ring buffer keeping one sample per metric per update cycle.
+    
+    Every metric lives in a preallocated array of doubles sharing one
+    timestamp array, so appends are O(1) and memory is fixed by the
+    capacity. Missing samples are stored as NaN.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.series = {}
+        self.count = 0
+        self.lock = threading.Lock()
+    
+    def append(self, timestamp, values):
+        """Stores one cycle's values, overwriting the oldest sample when full"""
+        with self.lock:
+            index = self.count % self.capacity
+            self.timestamps[index] = timestamp
+            for name in values.keys() - self.series.keys():
+                self.series[name] = array('d', [NAN]) * self.capacity
+            for name, series in self.series.items():
+                series[index] = values.get(name, NAN)
+            self.count += 1
+    
+    def update_latest(self, values):
+        """Overwrites the given metrics in the newest sample"""
+        with self.lock:
+            if not self.count:
+                return
+            index = (self.count - 1) % self.capacity
+            for name, value in values.items():
+                series = self.series.get(name)
+                if series is None:
+                    series = self.series[name] = array('d', [NAN]) * self.capacity
+                series[index] = value
+    
+    def last_timestamp(self):
+        """Returns the timestamp of the newest sample, 0 when empty"""
+        if not self.count:
+            return 0.0
+        return self.timestamps[(self.count - 1) % self.capacity]
+    
+    def metrics(self):
+        """Returns the names of all recorded metrics"""
+        with self.lock:
+            return sorted(self.series)
+    
+    def _physical(self, position, size):
+        """Maps a position in oldest-first order to an index in the arrays"""
+        return (self.count - size + position) % self.capacity
+    
+    def _bisect(self, timestamp, size, inclusive=False):
+        """First oldest-first position whose timestamp is >= timestamp (> when inclusive)"""
+        low, high = 0, size
+        while low < high:
+            middle = (low + high) // 2
+            sample = self.timestamps[self._physical(middle, size)]
+            if sample < timestamp or (inclusive and sample == timestamp):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+    
+    def range(self, name, start, end):
+        """Returns [(timestamp, value)] for one metric between start and end, oldest first"""
+        with self.lock:
+            series = self.series.get(name)
+            if series is None:
+                return []
+            size = min(self.count, self.capacity)
+            first = self._bisect(start, size)
+            last = self._bisect(end, size, inclusive=True)
+            points = []
+            for position in range(first, last):
+                index = self._physical(position, size)
+                # NaN where the metric was not sampled
+                if series[index] == series[index]:
+                    points.append((self.timestamps[index], series[index]))
+        return points
+    
+    def downsample(self, name, start, end, step):
+        """Returns [(bucket start, mean)] over buckets of step seconds, skipping empty buckets"""
+        buckets = {}
+        for timestamp, value in self.range(name, start, end):
+            if value != value:
+                continue
+            bucket = start + (timestamp - start) // step * step
+            total, count = buckets.get(bucket, (0.0, 0))
+            buckets[bucket] = (total + value, count + 1)
+        return [(bucket, total / count) for bucket, (total, count) in sorted(buckets.items())]
+
+
+def metric_number(value):
+    """Returns a numeric metric value, durations as seconds, NaN when not numeric"""
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str) and value.count(':') == 2:
+        return float(time_to_seconds(value))
+    return NAN
+
+def snapshot_metrics(snapshot, modules=None):
+    """Extracts the numeric values recorded in the metric history from a snapshot, for the given modules (default all)"""
+    if modules is None:
+        modules = MODULE_PARAMS
+    values = {
+        name: metric_number(getattr(snapshot, field)[key])
+        for name, (field, key) in HISTORY_METRICS.items()
+        if FIELD_MODULES[field] in modules and key in getattr(snapshot, field)
+    }
+    if 'agent_api_url' in modules:
+        values['alert_count'] = float(len(snapshot.alert_list))
+        values['aux_count'] = float(len(snapshot.aux_list))
+    if 'kpi_data_api_url' in modules:
+        for metric_id, kpi in snapshot.kpi_values.items():
+            values[f"kpi_{metric_id}"] = metric_number(kpi['value'])
+    return values
+
+# Agent state intervals
+StateChange = namedtuple('StateChange', ['agent', 'from_state', 'to_state', 'start', 'end'])
+
+class StateIntervalTracker:
+    """Derives agent state intervals from consecutive agent payloads.
+    
+    Each update emits a StateChange for every agent whose state changed,
+    appeared or left: from_state ran from start to end, when to_state began
+    (from_state is None for a newly seen agent, to_state None for one that
+    left). Per-agent totals for the day only include closed intervals, the
+    open one is added when totals are read, so an update costs time in the
+    number of changed agents rather than the size of the floor.
+    """
+    def __init__(self, max_recent_changes=1000):
+        self.current = {}
+        self.totals = {}
+        self.day = None
+        self.day_start = 0
+        self.recent_changes = deque(maxlen=max_recent_changes)
+        self.lock = threading.Lock()
+    
+    def update(self, agents, now):
+        """Takes {agent: (state, duration)} for one cycle and returns the StateChanges"""
+        with self.lock:
+            self.roll_day(now)
+            changes = []
+            current = self.current
+            for agent, (state, duration) in agents.items():
+                previous = current.get(agent)
+                if previous is not None and previous[0] == state:
+                    continue
+                # The payload's duration tells when the new state actually began
+                since = min(max(now - time_to_seconds(duration), self.day_start), now)
+                if previous is None:
+                    changes.append(StateChange(agent, None, state, None, since))
+                else:
+                    since = max(since, previous[1])
+                    changes.append(StateChange(agent, previous[0], state, previous[1], since))
+                    self.add_total(agent, previous[0], since - previous[1])
+                current[agent] = (state, since)
+            
+            for agent in current.keys() - agents.keys():
+                state, since = current.pop(agent)
+                changes.append(StateChange(agent, state, None, since, now))
+                self.add_total(agent, state, now - since)
+            
+            self.recent_changes.extend(changes)
+            return changes
+    
+    def roll_day(self, now):
+        """Resets totals at local midnight, splitting open intervals there"""
+        day = datetime.fromtimestamp(now).date()
+        if day == self.day:
+            return
+        self.day = day
+        self.day_start = datetime.combine(day, datetime.min.time()).timestamp()
+        self.totals = {}
+        for agent, (state, since) in self.current.items():
+            self.current[agent] = (state, max(since, self.day_start))
+    
+    def add_total(self, agent, state, seconds):
+        """Adds a closed interval to an agent's totals"""
+        agent_totals = self.totals.setdefault(agent, {})
+        agent_totals[state] = agent_totals.get(state, 0) + seconds
+    
+    def agent_totals(self, now, agent=None):
+        """Returns {agent: {state: seconds today}}, including the open intervals"""
+        with self.lock:
+            agents = [agent] if agent else list(self.totals.keys() | self.current.keys())
+            result = {}
+            for name in agents:
+                totals = dict(self.totals.get(name, {}))
+                if name in self.current:
+                    state, since = self.current[name]
+                    totals[state] = totals.get(state, 0) + max(now - since, 0)
+                if totals:
+                    result[name] = {state: round(seconds) for state, seconds in totals.items()}
+            return result
+    
+    def changes_since(self, since):
+        """Returns recent StateChanges that ended after since"""
+        with self.lock:
+            return [change for change in self.recent_changes if change.end > since]
+
+def agent_groups(snapshot, field, view):
+    """Rows of one of a snapshot's agent lists grouped by 'state' or 'alert', from its agent index"""
+    if snapshot.agent_index is None:
+        return {}
+    return snapshot.agent_index.groups(field, view)
+
+def snapshot_agents(snapshot):
+    """Returns {agent name: (DisplayState, duration)} for every agent in a snapshot"""
+    return {agent.name: (agent.state, agent.duration) for agent in snapshot.agents}
+
+# Durable history
+class HistoryStore:
+    """SQLite history of published snapshots.
+    
+    Snapshots are queued by the updater and written by a single writer thread,
+    one transaction per cycle, into a WAL-mode database. Raw 10 s samples are
+    rolled up into 1 min and 15 min tables and pruned by age; agent states are
+    stored as intervals. Readers use their own per-thread connections.
+    """
+    SAMPLE_TABLES = ('queue_samples', 'kpi_samples')
+    
+    def __init__(self, path):
+        self.path = path
+        self.pending = Queue(maxsize=HISTORY_QUEUE_SIZE)
+        self.local = threading.local()
+        self.open_intervals = {}
+        self.rolled_up_to = {}
+        self.stats = {'written': 0, 'dropped': 0, 'errors': 0}
+        self.writer = threading.Thread(target=self.run, name='history-writer', daemon=True)
+    
+    def connect(self):
+        """Opens a connection in WAL mode"""
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    
+    def reader(self):
+        """Returns this thread's read connection"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = self.connect()
+        return conn
+    
+    def start(self):
+        """Creates the schema and starts the writer thread"""
+        conn = self.connect()
+        with conn:
+            for table in self.SAMPLE_TABLES:
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (metric TEXT NOT NULL, ts INTEGER NOT NULL, value REAL, PRIMARY KEY (metric, ts)) WITHOUT ROWID")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_ts ON {table} (ts)")
+                for resolution in ROLLUP_RESOLUTIONS:
+                    rollup = f"{table}_{resolution}"
+                    conn.execute(f"CREATE TABLE IF NOT EXISTS {rollup} (metric TEXT NOT NULL, ts INTEGER NOT NULL, avg REAL, min REAL, max REAL, count INTEGER, PRIMARY KEY (metric, ts)) WITHOUT ROWID")
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS {rollup}_ts ON {rollup} (ts)")
+            conn.execute("CREATE TABLE IF NOT EXISTS agent_state_intervals (agent TEXT NOT NULL, start_ts INTEGER NOT NULL, end_ts INTEGER, state TEXT NOT NULL, PRIMARY KEY (agent, start_ts)) WITHOUT ROWID")
+            conn.execute("CREATE INDEX IF NOT EXISTS agent_state_intervals_start ON agent_state_intervals (start_ts)")
+        
+        # Intervals still open from a previous run carry on if the agent's state is unchanged
+        for agent, state, start_ts in conn.execute("SELECT agent, state, start_ts FROM agent_state_intervals WHERE end_ts IS NULL"):
+            self.open_intervals[agent] = (state, start_ts)
+        for table in self.SAMPLE_TABLES:
+            for resolution in ROLLUP_RESOLUTIONS:
+                last = conn.execute(f"SELECT MAX(ts) FROM {table}_{resolution}").fetchone()[0]
+                self.rolled_up_to[(table, resolution)] = last + ROLLUP_RESOLUTIONS[resolution] if last is not None else None
+        conn.close()
+        self.writer.start()
+    
+    def submit(self, snapshot, state_changes, fetched):
+        """Queues a published snapshot, its state changes and the modules it fetched, dropping them if the writer has fallen behind"""
+        try:
+            self.pending.put_nowait((snapshot, state_changes, fetched))
+        except Full:
+            self.stats['dropped'] += 1
+    
+    def run(self):
+        """Writer thread loop"""
+        conn = self.connect()
+        while True:
+            snapshot, state_changes, fetched = self.pending.get()
+            try:
+                self.write(conn, snapshot, state_changes, fetched)
+                self.stats['written'] += 1
+            except sqlite3.Error as e:
+                self.stats['errors'] += 1
+                print(f"Error writing history: {str(e)}")
+    
+    def write(self, conn, snapshot, state_changes, fetched):
+        """Writes one snapshot's samples of the fetched modules in a single transaction and runs any rollups that are due"""
+        ts = int(snapshot.published_at)
+        metrics = snapshot_metrics(snapshot, fetched)
+        queue_rows = [(name, ts, value) for name, value in metrics.items() if not name.startswith('kpi_') and value == value]
+        kpi_rows = []
+        if 'kpi_data_api_url' in fetched:
+            kpi_rows = [(str(metric_id), ts, metric_number(kpi['value'])) for metric_id, kpi in snapshot.kpi_values.items()]
+        
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO queue_samples (metric, ts, value) VALUES (?, ?, ?)", queue_rows)
+            conn.executemany("INSERT OR REPLACE INTO kpi_samples (metric, ts, value) VALUES (?, ?, ?)", kpi_rows)
+            self.write_intervals(conn, state_changes)
+            for table in self.SAMPLE_TABLES:
+                self.rollup(conn, table, ts)
+    
+    def write_intervals(self, conn, state_changes):
+        """Closes and opens agent_state_intervals rows from StateChange events"""
+        closed = []
+        opened = []
+        for change in state_changes:
+            open_interval = self.open_intervals.get(change.agent)
+            if change.from_state is None and open_interval and open_interval[0] == change.to_state:
+                # Interval left open by a previous run, still in the same state
+                continue
+            if open_interval:
+                closed.append((int(change.end), change.agent, open_interval[1]))
+                del self.open_intervals[change.agent]
+            if change.to_state is not None:
+                opened.append((change.agent, int(change.end), change.to_state))
+                self.open_intervals[change.agent] = (change.to_state, int(change.end))
+        conn.executemany("UPDATE agent_state_intervals SET end_ts = ? WHERE agent = ? AND start_ts = ?", closed)
+        conn.executemany("INSERT OR REPLACE INTO agent_state_intervals (agent, start_ts, end_ts, state) VALUES (?, ?, NULL, ?)", opened)
+    
+    def rollup(self, conn, table, ts):
+        """Aggregates completed buckets into each rollup table and prunes expired rows"""
+        source, source_level = table, 'raw'
+        for resolution, seconds in ROLLUP_RESOLUTIONS.items():
+            target = f"{table}_{resolution}"
+            complete = ts // seconds * seconds
+            start = self.rolled_up_to.get((table, resolution))
+            if start is None:
+                start = complete - seconds
+            if start >= complete:
+                return
+            
+            if source_level == 'raw':
+                aggregates = "AVG(value), MIN(value), MAX(value), COUNT(*)"
+            else:
+                aggregates = "SUM(avg * count) / SUM(count), MIN(min), MAX(max), SUM(count)"
+            conn.execute(f"""
+                INSERT OR REPLACE INTO {target} (metric, ts, avg, min, max, count)
+                SELECT metric, ts / {seconds} * {seconds}, {aggregates}
+                FROM {source} WHERE ts >= ? AND ts < ?
+                GROUP BY metric, ts / {seconds}
+            """, (start, complete))
+            self.rolled_up_to[(table, resolution)] = complete
+            
+            # Prune the source level once per completed bucket of the level above it
+            conn.execute(f"DELETE FROM {source} WHERE ts < ?", (ts - HISTORY_RETENTION[source_level],))
+            source, source_level = target, resolution
+        
+        conn.execute(f"DELETE FROM {source} WHERE ts < ?", (ts - HISTORY_RETENTION[source_level],))
+    
+    def samples(self, table, metric, start, end, resolution):
+        """Returns rows for one metric between start and end from the raw or a rollup table"""
+        if resolution == 'raw':
+            return self.reader().execute(
+                f"SELECT ts, value FROM {table} WHERE metric = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (metric, start, end)
+            ).fetchall()
+        return self.reader().execute(
+            f"SELECT ts, avg, min, max, count FROM {table}_{resolution} WHERE metric = ? AND ts >= ? AND ts < ? ORDER BY ts",
+            (metric, start, end)
+        ).fetchall()
+    
+    def intervals(self, start, end, agent=None):
+        """Returns state intervals overlapping start..end, optionally for one agent"""
+        query = "SELECT agent, state, start_ts, end_ts FROM agent_state_intervals WHERE start_ts < ? AND (end_ts IS NULL OR end_ts > ?)"
+        params = [end, start]
+        if agent:
+            query += " AND agent = ?"
+            params.append(agent)
+        return self.reader().execute(query + " ORDER BY start_ts", params).fetchall()
+
+# Polling schedule
+class PollScheduler:
+    """Deadline-based schedule with a separate cadence for each dashboard module of a tenant.
+    
+    Each module's next run is planned from its previous due time rather than
+    from when the last update finished, so cycles do not drift. The queue
+    module refreshes quickly while calls are waiting and backs off while the
+    queue is empty. wake_now() makes modules due immediately, or as soon as
+    their cycle completes when one is in flight. The condition is shared by
+    all tenants' schedules, so the FairScheduler waiting on it sees every
+    change.
+    """
+    def __init__(self, modules, breakers, condition):
+        now = time.monotonic()
+        self.next_due = {key: now for key in modules}
+        self.breakers = breakers
+        self.queue_idle_interval = POLL_INTERVALS['queue_api_url']
+        self.condition = condition
+        # Modules being fetched, and those woken while being fetched
+        self.in_flight = set()
+        self.pending_wake = set()
+    
+    def interval(self, key, snapshot):
+        """Seconds until the module should be fetched again"""
+        if key == 'queue_api_url':
+            if snapshot.has_queue_calls:
+                self.queue_idle_interval = POLL_INTERVALS['queue_api_url']
+                return QUEUE_BUSY_INTERVAL
+            interval = self.queue_idle_interval
+            self.queue_idle_interval = min(interval * QUEUE_IDLE_BACKOFF, QUEUE_IDLE_MAX_INTERVAL)
+            return interval
+        return POLL_INTERVALS[key]
+    
+    def due(self, now):
+        """Returns the modules due at now (call with the condition held)"""
+        return [key for key, at in self.next_due.items() if at <= now]
+    
+    def next_due_at(self):
+        """Monotonic time the next module comes due (call with the condition held)"""
+        return min(self.next_due.values())
+    
+    def started(self, modules):
+        """Marks modules as being fetched (call with the condition held)"""
+        self.in_flight.update(modules)
+    
+    def completed(self, modules, snapshot):
+        """Plans the next run of modules that were just fetched"""
+        now = time.monotonic()
+        wall_now = time.time()
+        with self.condition:
+            for key in modules:
+                interval = self.interval(key, snapshot)
+                interval *= 1 + random.uniform(-POLL_JITTER, POLL_JITTER)
+                next_due = self.next_due[key] + interval
+                if next_due <= now:
+                    # Fell behind, skip the missed runs instead of bursting to catch up
+                    next_due = now + interval
+                # A failing endpoint waits out its backoff or open circuit
+                next_due = max(next_due, now + self.breakers[key].retry_in(wall_now))
+                self.in_flight.discard(key)
+                if key in self.pending_wake:
+                    # Woken while this cycle was fetching, it may have missed the change
+                    self.pending_wake.discard(key)
+                    next_due = now
+                self.next_due[key] = next_due
+    
+    def wake_now(self, modules=None):
+        """Makes the given modules (default all) due immediately, or when their cycle in flight completes"""
+        with self.condition:
+            now = time.monotonic()
+            for key in modules or self.next_due:
+                if key in self.in_flight:
+                    self.pending_wake.add(key)
+                else:
+                    self.next_due[key] = min(self.next_due[key], now)
+            self.condition.notify_all()
+    
+    def schedule(self):
+        """Returns seconds until each module is next due"""
+        now = time.monotonic()
+        with self.condition:
+            return {key: round(max(at - now, 0), 2) for key, at in self.next_due.items()}
+
+# Tenants
+class Tenant:
+    """One monitored UJET site and everything derived from its data.
+    
+    Each tenant has its own endpoints, token and alert times, publishes its
+    own snapshots and keeps its own schedule, circuit breakers, caches and
+    history. The HTTP session and the fetch pool are shared by all tenants.
+    """
+    def __init__(self, tenant_id, name, endpoints, condition, token=None, alert_times=None, kpi_mapping=None, history_path=None):
+        self.id = tenant_id
+        self.name = name
+        self.endpoints = dict(endpoints)
+        parts = urlsplit(self.endpoints['agent_api_url'])
+        self.origin = f"{parts.scheme}://{parts.netloc}"
+        self.kpi_mapping = kpi_mapping or KPI_MAPPING
+        self.agent_data = {
+            'token': token,
+            'alert_times': {**DEFAULT_ALERT_TIMES, **(alert_times or {})}
+        }
+        self.state_classifier = StateClassifier(self.agent_data['alert_times'])
+        
+        # Latest published snapshot, swapped under snapshot_published which is notified on every publish
+        self.snapshot = EMPTY_SNAPSHOT
+        self.snapshot_published = threading.Condition()
+        # Changes between consecutive generations, oldest first, computed once at publish time
+        self.delta_history = ()
+        # (generation, {since: encoded body}) of /api/data/delta responses and /stream messages for the current generation
+        self.delta_response_cache = (None, {})
+        self.page_cache = PageCache()
+        # Compressed response bodies of the current generation, by path, query and encoding
+        self.compressed_cache = PageCache()
+        
+        # Per-endpoint fetch latency and cycle wall time
+        self.fetch_metrics = {
+            'endpoints': {},
+            'cycles': 0,
+            'last_cycle_time': None,
+            'last_cycle_serial_time': None
+        }
+        self.breakers = {key: CircuitBreaker(f"{tenant_id}/{key}") for key in MODULE_PARAMS}
+        self.scheduler = PollScheduler(MODULE_PARAMS, self.breakers, condition)
+        
+        self.metric_history = MetricHistory(max(int(HISTORY_WINDOW / HISTORY_RESOLUTION), 1))
+        self.state_tracker = StateIntervalTracker()
+        self.history_store = HistoryStore(history_path) if history_path else None
+    
+    def reset_state_classifier(self):
+        """Recompiles the state rules after the alert times change"""
+        self.state_classifier = StateClassifier(self.agent_data['alert_times'])
+
+def tenant_history_path(tenant_id):
+    """SQLite history file of a tenant: HISTORY_DB itself for the single default site, one file per tenant otherwise"""
+    if not HISTORY_DB:
+        return None
+    if not TENANTS_FILE:
+        return HISTORY_DB
+    root, extension = os.path.splitext(HISTORY_DB)
+    return f"{root}-{tenant_id}{extension}"
+
+def load_tenants(condition):
+    """Builds the tenants listed in TENANTS_FILE, or the default GNC site, keyed by id"""
+    if TENANTS_FILE:
+        with open(TENANTS_FILE) as f:
+            configs = json.load(f)
+    else:
+        configs = [{'id': 'gnc', 'name': 'GNC/Ujet', 'endpoints': API_ENDPOINTS}]
+    
+    loaded = {}
+    for config in configs:
+        tenant_id = str(config.get('id', ''))
+        if not TENANT_ID_PATTERN.match(tenant_id) or tenant_id in loaded:
+            raise ValueError(f"Tenant id {tenant_id!r} is missing, repeated or not made of letters, digits, - and _")
+        endpoints = config.get('endpoints', {})
+        missing = [key for key in MODULE_PARAMS if key not in endpoints]
+        if missing:
+            raise ValueError(f"Tenant {tenant_id!r} has no endpoint for {', '.join(missing)}")
+        alert_times = config.get('alert_times') or {}
+        unknown = [alert for alert in alert_times if alert not in DEFAULT_ALERT_TIMES]
+        if unknown:
+            raise ValueError(f"Tenant {tenant_id!r} has alert times for unknown alerts {', '.join(unknown)}")
+        invalid = [alert for alert, minutes in alert_times.items() if type(minutes) is not int or minutes < 0]
+        if invalid:
+            raise ValueError(f"Tenant {tenant_id!r} alert times for {', '.join(invalid)} must be whole minutes")
+        kpi_mapping = config.get('kpi_mapping')
+        loaded[tenant_id] = Tenant(
+            tenant_id,
+            config.get('name', tenant_id),
+            endpoints,
+            condition,
+            token=config.get('token'),
+            alert_times=alert_times,
+            kpi_mapping={int(metric_id): name for metric_id, name in kpi_mapping.items()} if kpi_mapping else None,
+            history_path=tenant_history_path(tenant_id)
+        )
+    if not loaded:
+        raise ValueError("No tenants configured")
+    return loaded
+
+class FairScheduler:
+    """Hands out update cycles across tenants in turn.
+    
+    A tenant with due modules gets at most one cycle queued or running at a
+    time, and the tenants are scanned round-robin starting after the last one
+    served, so a slow or busy site cannot starve the others of the shared
+    update workers and fetch pool. Tenants without a token are skipped.
+    """
+    def __init__(self, tenants, condition):
+        self.tenants = list(tenants)
+        self.condition = condition
+        self.busy = set()
+        self.turn = 0
+    
+    def wait_for_due(self):
+        """Blocks until a tenant that is not busy has due modules and returns (tenant, modules)"""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                count = len(self.tenants)
+                waiting = []
+                for offset in range(count):
+                    tenant = self.tenants[(self.turn + offset) % count]
+                    if tenant.id in self.busy or not tenant.agent_data['token']:
+                        continue
+                    due = tenant.scheduler.due(now)
+                    if due:
+                        self.turn = (self.turn + offset + 1) % count
+                        self.busy.add(tenant.id)
+                        tenant.scheduler.started(due)
+                        return tenant, due
+                    waiting.append(tenant.scheduler.next_due_at() - now)
+                # Woken early by wake_now(), a new token or a finished cycle
+                self.condition.wait(min(waiting) if waiting else None)
+    
+    def completed(self, tenant, modules):
+        """Plans the tenant's next run of modules and lets it be scheduled again"""
+        tenant.scheduler.completed(modules, tenant.snapshot)
+        with self.condition:
+            self.busy.discard(tenant.id)
+            self.condition.notify_all()
+
+# Shared by every tenant's PollScheduler and the FairScheduler
+schedule_condition = threading.Condition()
+tenants = load_tenants(schedule_condition)
+default_tenant = next(iter(tenants.values()))
+fair_scheduler = FairScheduler(tenants.values(), schedule_condition)
+update_executor = ThreadPoolExecutor(max_workers=UPDATE_WORKERS, thread_name_prefix='tenant-update')
+
+def current_tenant():
+    """Returns the tenant of the current request (?tenant= or the tenant cookie), default the first one"""
+    if not has_request_context():
+        return default_tenant
+    tenant = g.get('tenant')
+    if tenant is None:
+        tenant_id = request.args.get('tenant') or request.cookies.get(TENANT_COOKIE)
+        tenant = g.tenant = tenants.get(tenant_id, default_tenant)
+    return tenant
+
+def run_update_cycle(tenant, modules):
+    """Runs one update of a tenant's due modules on an update worker"""
+    try:
+        update_agent_data(tenant, modules)
+    except Exception as e:
+        print(f"Error updating {tenant.id}: {str(e)}")
+    finally:
+        fair_scheduler.completed(tenant, modules)
 
 def background_updater():
-    """Background thread to update data periodically"""
+    """Background thread handing each tenant's due modules to the update workers"""
     while True:
-        update_agent_data()
-        time.sleep(10)  # Update every 10 seconds
+        tenant, due = fair_scheduler.wait_for_due()
+        update_executor.submit(run_update_cycle, tenant, due)
 
 # Start background updater thread
-updater_thread = threading.Thread(target=background_updater)
+updater_thread = threading.Thread(target=background_updater, name='updater')
 updater_thread.daemon = True
 updater_thread.start()
 
+# Start history writer threads
+for store in [tenant.history_store for tenant in tenants.values() if tenant.history_store]:
+    store.start()
+
+class SamplingProfiler:
+    """Samples the stacks of the update and request threads for a bounded window.
+    
+    A daemon thread reads sys._current_frames() every interval and counts each
+    stack, root first and prefixed with the thread's role (updater,
+    update-worker, fetch or request), so collapsed() can be fed straight to
+    flamegraph.pl or speedscope. The run switches itself off once its window
+    is over; the counts stay available until the next run starts.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stacks = {}
+        self.samples = 0
+        self.dropped = 0
+        self.interval = PROFILE_INTERVAL
+        self.started_at = None
+        self.ends_at = None
+        self.stopped_at = None
+    
+    def running(self):
+        """Whether a run is sampling right now"""
+        return self.thread is not None and self.thread.is_alive()
+    
+    def start(self, seconds, interval=None):
+        """Starts a run of at most PROFILE_MAX_SECONDS, returns False if one is already running"""
+        with self.lock:
+            if self.running():
+                return False
+            self.stacks = {}
+            self.samples = 0
+            self.dropped = 0
+            self.interval = max(interval or PROFILE_INTERVAL, 0.001)
+            self.started_at = time.time()
+            self.ends_at = self.started_at + min(seconds, PROFILE_MAX_SECONDS)
+            self.stopped_at = None
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name='profiler', daemon=True)
+            self.thread.start()
+        print(f"Profiling for {self.ends_at - self.started_at:.0f}s every {self.interval * 1000:.0f}ms")
+        return True
+    
+    def stop(self):
+        """Ends the current run early"""
+        self.stop_event.set()
+        thread = self.thread
+        if thread is not None:
+            thread.join()
+    
+    def run(self):
+        while time.time() < self.ends_at and not self.stop_event.is_set():
+            self.sample()
+            self.stop_event.wait(self.interval)
+        self.stopped_at = time.time()
+        print(f"Profiling stopped after {self.samples} samples")
+    
+    def sample(self):
+        """Counts the current stack of every profiled thread"""
+        frames = sys._current_frames()
+        with self.lock:
+            for thread in threading.enumerate():
+                frame = frames.get(thread.ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                role = profile_thread_role(thread, stack)
+                # Pool threads blocked on their empty work queue are idle, not slow
+                if role is None or stack[0].startswith('_worker (thread.py:'):
+                    continue
+                stack.append(role)
+                key = ';'.join(reversed(stack))
+                if key not in self.stacks and len(self.stacks) >= PROFILE_MAX_STACKS:
+                    self.dropped += 1
+                    continue
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+    
+    def status(self):
+        """Window, interval and counts of the last or current run"""
+        return {
+            'running': self.running(),
+            'started_at': self.started_at,
+            'ends_at': self.ends_at,
+            'stopped_at': self.stopped_at,
+            'interval': self.interval,
+            'samples': self.samples,
+            'stacks': len(self.stacks),
+            'dropped': self.dropped
+        }
+    
+    def collapsed(self):
+        """Returns the counted stacks in the collapsed format, one "frame;frame;... count" per line"""
+        with self.lock:
+            stacks = sorted(self.stacks.items())
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+def profile_thread_role(thread, stack):
+    """Names what a thread does for the profile, or None for threads that are not profiled"""
+    if thread is updater_thread:
+        return 'updater'
+    if thread.name.startswith('tenant-update'):
+        return 'update-worker'
+    if thread.name.startswith('ujet-fetch'):
+        return 'fetch'
+    # Flask worker threads, whatever the WSGI server names them, while they handle a request
+    if any(frame.startswith('wsgi_app (app.py:') for frame in stack):
+        return 'request'
+    return None
+
+profiler = SamplingProfiler()
+if PROFILE_ON_START > 0:
+    profiler.start(PROFILE_ON_START)
+
+@lru_cache(maxsize=None)
+def static_version(filename):
+    """Short hash of a static file's content, read once per process"""
+    with open(os.path.join(app.static_folder, filename), 'rb') as f:
+        return format(zlib.crc32(f.read()), '08x')
+
+def static_url(filename):
+    """URL of a static file that changes whenever the file does, so it can be cached for good"""
+    return url_for('static', filename=filename, v=static_version(filename))
+
+app.jinja_env.globals['static_url'] = static_url
+
+def load_templates():
+    """Compiles every template at startup (from the bytecode cache when it is warm), so no request pays for it"""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+load_templates()
+
+@app.before_request
+def start_request_timer():
+    """Notes when the request started, for the route timing histogram"""
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    """Records how long the endpoint took to handle and render the request"""
+    start = g.get('request_start')
+    if start is not None:
+        timing_metrics.observe('sla_monitor_route_seconds', (request.endpoint or 'unmatched',), time.perf_counter() - start)
+    return response
+
 # Routes
 @app.route('/')
 def login():
     """Login page to enter access token"""
-    if agent_data['token']:
-        return redirect(url_for('dashboard'))
+    tenant = current_tenant()
+    if tenant.agent_data['token']:
+        response = redirect(url_for('dashboard'))
+        response.set_cookie(TENANT_COOKIE, tenant.id, samesite='Lax')
+        return response
     
-    return render_template_string('''
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Token Authentication</title>
-            <style>
-                body {
-                    font-family: Arial, sans-serif;
-                    background-color: #F6F0FF;
-                    margin: 0;
-                    padding: 0;
-                    display: flex;
-                    justify-content: center;
-                    align-items: center;
-                    height: 100vh;
-                }
-                .login-container {
-                    background-color: white;
-                    border-radius: 10px;
-                    box-shadow: 0 0 20px rgba(0, 0, 0, 0.1);
-                    width: 400px;
-                    padding: 30px;
-                    text-align: center;
-                }
-                .logo {
-                    background-color: #6A0DAD;
-                    color: white;
-                    padding: 15px;
-                    border-radius: 15px;
-                    font-size: 24px;
-                    font-weight: bold;
-                    margin-bottom: 20px;
-                    display: inline-block;
-                }
-                h1 {
-                    color: #6A0DAD;
-                    margin-bottom: 30px;
-                }
-                .form-group {
-                    margin-bottom: 20px;
-                    text-align: left;
-                }
-                label {
-                    display: block;
-                    margin-bottom: 5px;
-                    font-weight: bold;
-                    color: #555;
-                }
-                input[type="password"] {
-                    width: 100%;
-                    padding: 10px;
-                    border: 2px solid #ddd;
-                    border-radius: 5px;
-                    font-size: 16px;
-                    box-sizing: border-box;
-                }
-                .btn {
-                    background-color: #6A0DAD;
-                    color: white;
-                    border: none;
-                    padding: 10px 20px;
-                    font-size: 16px;
-                    border-radius: 5px;
-                    cursor: pointer;
-                    font-weight: bold;
-                    margin: 5px;
-                }
-                .btn:hover {
-                    background-color: #5a0b9d;
-                }
-                .btn-exit {
-                    background-color: #D32F2F;
-                }
-                .btn-exit:hover {
-                    background-color: #b71c1c;
-                }
-                .message {
-                    margin-top: 20px;
-                    padding: 10px;
-                    border-radius: 5px;
-                    font-size: 14px;
-                }
-                .error {
-                    color: red;
-                }
-                .success {
-                    color: green;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="login-container">
-                <div class="logo">GNC/Ujet</div>
-                <h1>Token Authentication</h1>
-                <form method="POST" action="/verify_token">
-                    <div class="form-group">
-                        <label for="token">Enter Access Token:</label>
-                        <input type="password" id="token" name="token" required>
-                    </div>
-                    {% if message %}
-                    <div class="message {{ message_type }}">{{ message }}</div>
-                    {% endif %}
-                    <div>
-                        <button type="submit" class="btn">Verify Token</button>
-                        <button type="button" class="btn btn-exit" onclick="window.close()">Exit</button>
-                    </div>
-                </form>
-            </div>
-        </body>
-        </html>
-    ''', message=request.args.get('message'), message_type=request.args.get('message_type'))
+    return render_template('login.html', message=request.args.get('message'), message_type=request.args.get('message_type'),
+    tenants=list(tenants.values()), current_tenant_id=tenant.id)
 
 @app.route('/verify_token', methods=['POST'])
 def verify_token():
     """Verify the provided token"""
+    tenant = tenants.get(request.form.get('tenant')) or current_tenant()
     token = request.form.get('token', '').strip()
     
     if not token:
-        return redirect(url_for('login', message='Please enter a token', message_type='error'))
+        return redirect(url_for('login', tenant=tenant.id, message='Please enter a token', message_type='error'))
     
     try:
-        headers = get_headers(token)
-        response = requests.get(
-            API_ENDPOINTS['agent_api_url'],
-            headers=headers,
-            params={
-                "isAutoRefresh": "false",
-                "isFirstLoad": "true",
-                "isCxOne": "false",
-                "useMetrics": "false"
-            },
-            timeout=15
+        headers = get_headers(token, tenant.origin)
+        response = http_get(
+            tenant.endpoints['agent_api_url'],
+            headers,
+            params=MODULE_PARAMS['agent_api_url']
         )
         
         if response.status_code == 200:
             data = response.json()
             if data.get('status', '').lower() == 'success' and 'data' in data and 'RowValues' in data['data']:
-                agent_data['token'] = token
-                return redirect(url_for('dashboard'))
+                tenant.agent_data['token'] = token
+                tenant.scheduler.wake_now()
+                response = redirect(url_for('dashboard'))
+                response.set_cookie(TENANT_COOKIE, tenant.id, samesite='Lax')
+                return response
             else:
                 error_msg = data.get('message', 'Invalid token response. Please try again.')
-                return redirect(url_for('login', message=f"Error: {error_msg}", message_type='error'))
+                return redirect(url_for('login', tenant=tenant.id, message=f"Error: {error_msg}", message_type='error'))
         else:
             error_msg = f"Server returned status code {response.status_code}"
             try:
@@ -435,938 +2706,435 @@ def verify_token():
                 error_msg = error_data.get('message', error_msg)
             except ValueError:
                 pass
-            return redirect(url_for('login', message=f"Error: {error_msg}", message_type='error'))
-            
+            return redirect(url_for('login', tenant=tenant.id, message=f"Error: {error_msg}", message_type='error'))
+    
     except requests.exceptions.RequestException as e:
-        return redirect(url_for('login', message=f"Connection error: {str(e)}", message_type='error'))
+        return redirect(url_for('login', tenant=tenant.id, message=f"Connection error: {str(e)}", message_type='error'))
     except Exception as e:
-        return redirect(url_for('login', message=f"An unexpected error occurred: {str(e)}", message_type='error'))
+        return redirect(url_for('login', tenant=tenant.id, message=f"An unexpected error occurred: {str(e)}", message_type='error'))
+
+@app.route('/tenant/<tenant_id>')
+def switch_tenant(tenant_id):
+    """Switches this browser to another tenant's dashboard"""
+    tenant = tenants.get(tenant_id)
+    if tenant is None:
+        return redirect(url_for('dashboard'))
+    response = redirect(url_for('dashboard') if tenant.agent_data['token'] else url_for('login', tenant=tenant.id))
+    response.set_cookie(TENANT_COOKIE, tenant.id, samesite='Lax')
+    return response
 
 @app.route('/dashboard')
 @token_required
+@conditional_on_generation
+@cached_page()
 def dashboard():
     """Main dashboard page"""
-    return render_template_string('''
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Agent Monitor - IntouchCX</title>
-            <style>
-                body {
-                    font-family: Arial, sans-serif;
-                    background-color: #F6F0FF;
-                    margin: 0;
-                    padding: 0;
-                }
-                .header {
-                    background-color: white;
-                    padding: 20px;
-                    box-shadow: 0 2px 10px rgba(0, 0, 0, 0.1);
-                    display: flex;
-                    justify-content: space-between;
-                    align-items: center;
-                }
-                .logo {
-                    background-color: #6A0DAD;
-                    color: white;
-                    padding: 10px 20px;
-                    border-radius: 15px;
-                    font-size: 20px;
-                    font-weight: bold;
-                    display: inline-block;
-                }
-                .company-name {
-                    color: #6A0DAD;
-                    font-size: 35px;
-                    font-weight: bold;
-                }
-                .notification {
-                    background-color: red;
-                    color: white;
-                    padding: 10px;
-                    text-align: center;
-                    font-weight: bold;
-                    margin: 10px;
-                    border-radius: 5px;
-                    display: {% if has_queue_calls %}block{% else %}none{% endif %};
-                }
-                .dashboard-container {
-                    display: flex;
-                    padding: 20px;
-                    gap: 20px;
-                }
-                .panel {
-                    flex: 1;
-                    background-color: white;
-                    border-radius: 10px;
-                    box-shadow: 0 0 10px rgba(0, 0, 0, 0.1);
-                    padding: 15px;
-                }
-                .panel-title {
-                    background-color: #6A0DAD;
-                    color: white;
-                    padding: 10px;
-                    border-radius: 5px;
-                    font-weight: bold;
-                    margin-bottom: 15px;
-                    text-align: center;
-                }
-                table {
-                    width: 100%;
-                    border-collapse: collapse;
-                }
-                th, td {
-                    padding: 10px;
-                    text-align: left;
-                    border-bottom: 1px solid #ddd;
-                }
-                th {
-                    background-color: #f2f2f2;
-                }
-                tr:nth-child(even) {
-                    background-color: #DAC8FF;
-                }
-                tr:nth-child(odd) {
-                    background-color: #D0B5FF;
-                }
-                .button-container {
-                    display: flex;
-                    justify-content: center;
-                    gap: 10px;
-                    margin-top: 20px;
-                    flex-wrap: wrap;
-                }
-                .btn {
-                    background-color: #6A0DAD;
-                    color: white;
-                    border: none;
-                    padding: 10px 20px;
-                    font-size: 16px;
-                    border-radius: 5px;
-                    cursor: pointer;
-                    font-weight: bold;
-                    text-decoration: none;
-                    display: inline-block;
-                }
-                .btn:hover {
-                    background-color: #5a0b9d;
-                }
-                .change-token {
-                    position: fixed;
-                    bottom: 20px;
-                    right: 20px;
-                    background-color: #6A0DAD;
-                    color: white;
-                    padding: 10px 15px;
-                    border-radius: 5px;
-                    text-decoration: none;
-                    font-weight: bold;
-                }
-                .change-token:hover {
-                    background-color: #5a0b9d;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <div class="company-name">IntouchCX</div>
-                <div class="logo">GNC/Ujet</div>
-            </div>
-            
-            <div class="notification" id="notification">
-                ⚠️ Contacts in Queue: {{ queue_data['Contacts in Queue'] }} | 
-                Longest Wait: {{ queue_data['Longest waiting time'] }} | 
-                Callbacks: {{ queue_data['Callbacks in Queue'] }} ⚠️
-            </div>
-            
-            <div class="dashboard-container">
-                <div class="panel">
-                    <div class="panel-title">Agents in Chat</div>
-                    <table>
-                        <thead>
-                            <tr>
-                                <th>Agent Name</th>
-                                <th>State</th>
-                                <th>Duration</th>
-                                <th>Since</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                            {% for agent in chat_agents %}
-                            <tr>
-                                <td>{{ agent[0] }}</td>
-                                <td>{{ agent[1] }}</td>
-                                <td>{{ agent[2] }}</td>
-                                <td>{{ agent[3] }}</td>
-                            </tr>
-                            {% else %}
-                            <tr>
-                                <td colspan="4" style="text-align: center;">No agents in chat</td>
-                            </tr>
-                            {% endfor %}
-                        </tbody>
-                    </table>
-                </div>
-                
-                <div class="panel">
-                    <div class="panel-title">Available/In-Call Agents</div>
-                    <table>
-                        <thead>
-                            <tr>
-                                <th>Agent Name</th>
-                                <th>State</th>
-                                <th>Duration</th>
-                                <th>Since</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                            {% for agent in available_agents %}
-                            <tr>
-                                <td>{{ agent[0] }}</td>
-                                <td>{{ agent[1] }}</td>
-                                <td>{{ agent[2] }}</td>
-                                <td>{{ agent[3] }}</td>
-                            </tr>
-                            {% else %}
-                            <tr>
-                                <td colspan="4" style="text-align: center;">No available agents</td>
-                            </tr>
-                            {% endfor %}
-                            {% for agent in on_call_agents %}
-                            <tr>
-                                <td>{{ agent[0] }}</td>
-                                <td>{{ agent[1] }}</td>
-                                <td>{{ agent[2] }}</td>
-                                <td>{{ agent[3] }}</td>
-                            </tr>
-                            {% endfor %}
-                        </tbody>
-                    </table>
-                </div>
-            </div>
-            
-            <div class="button-container">
-                <a href="/alerts" class="btn">View Alerts</a>
-                <a href="/aux" class="btn">View AUX Status</a>
-                <a href="/queue" class="btn">View Queue</a>
-                <a href="/agent_states" class="btn">Agent States</a>
-                <a href="/kpis" class="btn">View KPIs</a>
-                <a href="/settings" class="btn">Settings</a>
-            </div>
-            
-            <a href="/change_token" class="change-token">Change Token</a>
-            
-            <script>
-                // Auto-refresh every 10 seconds
-                setTimeout(function() {
-                    window.location.reload();
-                }, 10000);
-            </script>
-        </body>
-        </html>
-    ''', 
-    chat_agents=agent_data['chat_agents'],
-    available_agents=agent_data['available_agents'],
-    on_call_agents=agent_data['on_call_agents'],
-    queue_data=agent_data['queue_data'],
-    has_queue_calls=agent_data['has_queue_calls'])
+    snapshot = get_snapshot()
+    return render_template('dashboard.html', 
+    chat_agents=snapshot.chat_agents,
+    available_agents=snapshot.available_agents,
+    on_call_agents=snapshot.on_call_agents,
+    queue_data=snapshot.queue_data,
+    has_queue_calls=snapshot.has_queue_calls,
+    tenant_name=current_tenant().name,
+    stale=stale_notice(snapshot, 'agent_api_url', 'queue_api_url'),
+    stale_after=stale_thresholds())
 
 @app.route('/alerts')
 @token_required
+@conditional_on_generation
+@cached_page()
 def alerts():
     """Active alerts page"""
-    return render_template_string('''
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <meta http-equiv="refresh" content="15">
-            <title>Active Alerts</title>
-            <style>
-                body {
-                    font-family: Arial, sans-serif;
-                    background-color: #FFB6C1;
-                    margin: 0;
-                    padding: 0;
-                }
-                .container {
-                    max-width: 800px;
-                    margin: 0 auto;
-                    padding: 20px;
-                    background-color: white;
-                    border-radius: 10px;
-                    box-shadow: 0 0 20px rgba(0, 0, 0, 0.1);
-                    margin-top: 20px;
-                    margin-bottom: 20px;
-                }
-                h1 {
-                    text-align: center;
-                    color: black;
-                    margin-bottom: 20px;
-                }
-                .alert-section {
-                    margin-bottom: 20px;
-                }
-                .alert-title {
-                    font-weight: bold;
-                    font-size: 18px;
-                    color: red;
-                    margin-bottom: 10px;
-                }
-                .alert-item {
-                    margin-left: 20px;
-                    margin-bottom: 5px;
-                }
-                .no-alerts {
-                    text-align: center;
-                    color: gray;
-                    font-style: italic;
-                    padding: 20px;
-                }
-                .btn {
-                    display: block;
-                    width: 150px;
-                    margin: 20px auto;
-                    background-color: red;
-                    color: white;
-                    border: none;
-                    padding: 10px;
-                    font-size: 16px;
-                    border-radius: 5px;
-                    cursor: pointer;
-                    font-weight: bold;
-                    text-align: center;
-                    text-decoration: none;
-                }
-                .btn:hover {
-                    background-color: #d32f2f;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>⚠️ ACTIVE ALERTS ⚠️</h1>
-                
-                {% if alert_list %}
-                    {% set alerts_dict = {} %}
-                    {% for alert in alert_list %}
-                        {% if alert[0] not in alerts_dict %}
-                            {% set _ = alerts_dict.update({alert[0]: []}) %}
-                        {% endif %}
-                        {% set _ = alerts_dict[alert[0]].append(alert[1] + " - " + alert[3] + " (" + alert[2] + ")") %}
-                    {% endfor %}
-                    
-                    {% for alert_type, agents in alerts_dict.items() %}
-                        <div class="alert-section">
-                            <div class="alert-title">{{ alert_type.upper() }}</div>
-                            {% for agent in agents %}
-                                <div class="alert-item">{{ agent }}</div>
-                            {% endfor %}
-                        </div>
-                    {% endfor %}
-                {% else %}
-                    <div class="no-alerts">No active alerts at the moment.</div>
-                {% endif %}
-                
-                <a href="/dashboard" class="btn">Close</a>
-            </div>
-        </body>
-        </html>
-    ''', alert_list=agent_data['alert_list'])
+    snapshot = get_snapshot()
+    return render_template('alerts.html', alert_groups=agent_groups(snapshot, 'alert', snapshot.alert_list), stale=stale_notice(snapshot, 'agent_api_url'), stale_after=stale_thresholds())
 
 @app.route('/aux')
 @token_required
+@conditional_on_generation
+@cached_page()
 def aux_status():
     """AUX/Special states page"""
-    return render_template_string('''
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>AUX/Special States</title>
-            <style>
-                body {
-                    font-family: Arial, sans-serif;
-                    background-color: #FFB6C1;
-                    margin: 0;
-                    padding: 0;
-                }
-                .container {
-                    max-width: 800px;
-                    margin: 0 auto;
-                    padding: 20px;
-                    background-color: white;
-                    border-radius: 10px;
-                    box-shadow: 0 0 20px rgba(0, 0, 0, 0.1);
-                    margin-top: 20px;
-                    margin-bottom: 20px;
-                }
-                h1 {
-                    text-align: center;
-                    color: black;
-                    margin-bottom: 20px;
-                }
-                .state-section {
-                    margin-bottom: 20px;
-                }
-                .state-title {
-                    font-weight: bold;
-                    font-size: 18px;
-                    color: purple;
-                    margin-bottom: 10px;
-                }
-                .state-item {
-                    margin-left: 20px;
-                    margin-bottom: 5px;
-                }
-                .no-states {
-                    text-align: center;
-                    color: gray;
-                    font-style: italic;
-                    padding: 20px;
-                }
-                .btn {
-                    display: block;
-                    width: 150px;
-                    margin: 20px auto;
-                    background-color: red;
-                    color: white;
-                    border: none;
-                    padding: 10px;
-                    font-size: 16px;
-                    border-radius: 5px;
-                    cursor: pointer;
-                    font-weight: bold;
-                    text-align: center;
-                    text-decoration: none;
-                }
-                .btn:hover {
-                    background-color: #d32f2f;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>AUX/Special States</h1>
-                
-                {% if aux_list %}
-                    {% set states_dict = {} %}
-                    {% for state in aux_list %}
-                        {% if state[0] not in states_dict %}
-                            {% set _ = states_dict.update({state[0]: []}) %}
-                        {% endif %}
-                        {% set _ = states_dict[state[0]].append(state[1] + " - " + state[2] + " (since " + state[3] + ")") %}
-                    {% endfor %}
-                    
-                    {% for state, agents in states_dict.items() %}
-                        <div class="state-section">
-                            <div class="state-title">{{ state }}</div>
-                            {% for agent in agents %}
-                                <div class="state-item">{{ agent }}</div>
-                            {% endfor %}
-                        </div>
-                    {% endfor %}
-                {% else %}
-                    <div class="no-states">No agents in AUX or special states.</div>
-                {% endif %}
-                
-                <a href="/dashboard" class="btn">Close</a>
-            </div>
-        </body>
-        </html>
-    ''', aux_list=agent_data['aux_list'])
+    snapshot = get_snapshot()
+    return render_template('aux.html', aux_groups=agent_groups(snapshot, 'state', snapshot.aux_list), stale=stale_notice(snapshot, 'agent_api_url'))
 
 @app.route('/queue')
 @token_required
+@conditional_on_generation
+@cached_page()
 def queue_status():
     """Queue status page"""
-    return render_template_string('''
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Queue Status</title>
-            <style>
-                body {
-                    font-family: Arial, sans-serif;
-                    background-color: #E8F5E9;
-                    margin: 0;
-                    padding: 0;
-                }
-                .container {
-                    max-width: 600px;
-                    margin: 0 auto;
-                    padding: 20px;
-                    background-color: white;
-                    border-radius: 10px;
-                    box-shadow: 0 0 20px rgba(0, 0, 0, 0.1);
-                    margin-top: 20px;
-                    margin-bottom: 20px;
-                }
-                h1 {
-                    text-align: center;
-                    color: #2E7D32;
-                    margin-bottom: 20px;
-                }
-                .data-row {
-                    display: flex;
-                    justify-content: space-between;
-                    margin-bottom: 10px;
-                    padding: 10px;
-                    border-bottom: 1px solid #eee;
-                }
-                .label {
-                    font-weight: normal;
-                    color: #555;
-                }
-                .value {
-                    font-weight: bold;
-                    color: #2E7D32;
-                }
-                .update-time {
-                    text-align: right;
-                    color: #555;
-                    font-size: 12px;
-                    margin-top: 20px;
-                }
-                .btn {
-                    display: block;
-                    width: 150px;
-                    margin: 20px auto;
-                    background-color: #2E7D32;
-                    color: white;
-                    border: none;
-                    padding: 10px;
-                    font-size: 16px;
-                    border-radius: 5px;
-                    cursor: pointer;
-                    font-weight: bold;
-                    text-align: center;
-                    text-decoration: none;
-                }
-                .btn:hover {
-                    background-color: #1B5E20;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>QUEUE STATUS</h1>
-                
-                <div class="data-row">
-                    <span class="label">Contacts in Queue:</span>
-                    <span class="value">{{ queue_data['Contacts in Queue'] }}</span>
-                </div>
-                
-                <div class="data-row">
-                    <span class="label">Longest Waiting Time:</span>
-                    <span class="value">{{ queue_data['Longest waiting time'] }}</span>
-                </div>
-                
-                <div class="data-row">
-                    <span class="label">Callbacks in Queue:</span>
-                    <span class="value">{{ queue_data['Callbacks in Queue'] }}</span>
-                </div>
-                
-                <div class="data-row">
-                    <span class="label">Total Agents:</span>
-                    <span class="value">{{ queue_data['Total Agents'] }}</span>
-                </div>
-                
-                <div class="update-time">
-                    Last update: {{ queue_data['Last Update'] }}
-                </div>
-                
-                <a href="/dashboard" class="btn">Close</a>
-            </div>
-        </body>
-        </html>
-    ''', queue_data=agent_data['queue_data'])
+    snapshot = get_snapshot()
+    return render_template('queue.html', queue_data=snapshot.queue_data, stale=stale_notice(snapshot, 'queue_api_url'))
 
 @app.route('/agent_states')
 @token_required
+@conditional_on_generation
+@cached_page()
 def agent_states():
     """Agent states summary page"""
-    return render_template_string('''
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Agent States Summary</title>
-            <style>
-                body {
-                    font-family: Arial, sans-serif;
-                    background-color: #E3F2FD;
-                    margin: 0;
-                    padding: 0;
-                }
-                .container {
-                    max-width: 600px;
-                    margin: 0 auto;
-                    padding: 20px;
-                    background-color: white;
-                    border-radius: 10px;
-                    box-shadow: 0 0 20px rgba(0, 0, 0, 0.1);
-                    margin-top: 20px;
-                    margin-bottom: 20px;
-                }
-                h1 {
-                    text-align: center;
-                    color: #0D47A1;
-                    margin-bottom: 20px;
-                }
-                .data-row {
-                    display: flex;
-                    justify-content: space-between;
-                    margin-bottom: 10px;
-                    padding: 10px;
-                    border-bottom: 1px solid #eee;
-                }
-                .label {
-                    font-weight: normal;
-                    color: #555;
-                }
-                .value {
-                    font-weight: bold;
-                    color: #0D47A1;
-                }
-                .update-time {
-                    text-align: right;
-                    color: #555;
-                    font-size: 12px;
-                    margin-top: 20px;
-                }
-                .btn {
-                    display: block;
-                    width: 150px;
-                    margin: 20px auto;
-                    background-color: #0D47A1;
-                    color: white;
-                    border: none;
-                    padding: 10px;
-                    font-size: 16px;
-                    border-radius: 5px;
-                    cursor: pointer;
-                    font-weight: bold;
-                    text-align: center;
-                    text-decoration: none;
-                }
-                .btn:hover {
-                    background-color: #0D2C7D;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>AGENT STATES SUMMARY</h1>
-                
-                <div class="data-row">
-                    <span class="label">Total Agents:</span>
-                    <span class="value">{{ agent_counter_data['Total Agents'] }}</span>
-                </div>
-                
-                <div class="data-row">
-                    <span class="label">Available:</span>
-                    <span class="value">{{ agent_counter_data['Available'] }}</span>
-                </div>
-                
-                <div class="data-row">
-                    <span class="label">Unavailable:</span>
-                    <span class="value">{{ agent_counter_data['Unavailable'] }}</span>
-                </div>
-                
-                <div class="data-row">
-                    <span class="label">Inbound:</span>
-                    <span class="value">{{ agent_counter_data['Inbound'] }}</span>
-                </div>
-                
-                <div class="data-row">
-                    <span class="label">Outbound:</span>
-                    <span class="value">{{ agent_counter_data['Outbound'] }}</span>
-                </div>
-                
-                <div class="data-row">
-                    <span class="label">After Call Work:</span>
-                    <span class="value">{{ agent_counter_data['Acw'] }}</span>
-                </div>
-                
-                <div class="data-row">
-                    <span class="label">Waiting:</span>
-                    <span class="value">{{ agent_counter_data['Waiting'] }}</span>
-                </div>
-                
-                <div class="data-row">
-                    <span class="label">Preview:</span>
-                    <span class="value">{{ agent_counter_data['Preview'] }}</span>
-                </div>
-                
-                <div class="data-row">
-                    <span class="label">Dialer:</span>
-                    <span class="value">{{ agent_counter_data['Dialer'] }}</span>
-                </div>
-                
-                <div class="update-time">
-                    Last update: {{ agent_counter_data['Last Update'] }}
-                </div>
-                
-                <a href="/dashboard" class="btn">Close</a>
-            </div>
-        </body>
-        </html>
-    ''', agent_counter_data=agent_data['agent_counter_data'])
+    snapshot = get_snapshot()
+    return render_template('agent_states.html', agent_counter_data=snapshot.agent_counter_data, stale=stale_notice(snapshot, 'agent_counter_api_url'))
 
 @app.route('/kpis')
 @token_required
+@conditional_on_generation
+@cached_page()
 def kpis():
     """Key Performance Indicators page"""
-    return render_template_string('''
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Key Performance Indicators</title>
-            <style>
-                body {
-                    font-family: Arial, sans-serif;
-                    background-color: #E8F5E9;
-                    margin: 0;
-                    padding: 0;
-                }
-                .container {
-                    max-width: 600px;
-                    margin: 0 auto;
-                    padding: 20px;
-                    background-color: white;
-                    border-radius: 10px;
-                    box-shadow: 0 0 20px rgba(0, 0, 0, 0.1);
-                    margin-top: 20px;
-                    margin-bottom: 20px;
-                }
-                h1 {
-                    text-align: center;
-                    color: #2E7D32;
-                    margin-bottom: 20px;
-                }
-                .kpi-item {
-                    border: 1px solid #ddd;
-                    border-radius: 5px;
-                    padding: 15px;
-                    margin-bottom: 15px;
-                }
-                .kpi-name {
-                    font-weight: bold;
-                    font-size: 16px;
-                    color: #333;
-                    margin-bottom: 5px;
-                }
-                .kpi-value {
-                    font-size: 20px;
-                    color: #2E7D32;
-                    text-align: right;
-                }
-                .button-container {
-                    display: flex;
-                    justify-content: center;
-                    gap: 10px;
-                    margin-top: 20px;
-                }
-                .btn {
-                    background-color: #2E7D32;
-                    color: white;
-                    border: none;
-                    padding: 10px 20px;
-                    font-size: 16px;
-                    border-radius: 5px;
-                    cursor: pointer;
-                    font-weight: bold;
-                    text-decoration: none;
-                }
-                .btn:hover {
-                    background-color: #1B5E20;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>KEY PERFORMANCE INDICATORS</h1>
-                
-                {% if kpi_values %}
-                    {% for metric_id, kpi in kpi_values.items() %}
-                        <div class="kpi-item">
-                            <div class="kpi-name">{{ kpi['name'] }}</div>
-                            <div class="kpi-value">{{ kpi['display'] }}</div>
-                        </div>
-                    {% endfor %}
-                {% else %}
-                    <div style="text-align: center; color: gray; font-style: italic; padding: 20px;">
-                        No KPI data available
-                    </div>
-                {% endif %}
-                
-                <div class="button-container">
-                    <a href="/dashboard" class="btn">Close</a>
-                    <a href="/kpis" class="btn">Refresh</a>
-                </div>
-            </div>
-        </body>
-        </html>
-    ''', kpi_values=agent_data['kpi_values'])
+    snapshot = get_snapshot()
+    return render_template('kpis.html', kpi_values=snapshot.kpi_values, stale=stale_notice(snapshot, 'kpi_data_api_url'))
 
 @app.route('/settings', methods=['GET', 'POST'])
 @token_required
 def settings():
     """Alert settings page"""
+    tenant = current_tenant()
     if request.method == 'POST':
         if 'apply' in request.form:
             try:
-                for alert in agent_data['alert_times']:
-                    agent_data['alert_times'][alert] = int(request.form.get(alert, 0))
+                for alert in tenant.agent_data['alert_times']:
+                    tenant.agent_data['alert_times'][alert] = int(request.form.get(alert, 0))
                 return redirect(url_for('settings', message='Custom times applied successfully!', message_type='success'))
             except ValueError:
                 return redirect(url_for('settings', message='Please enter valid numbers for all fields.', message_type='error'))
+            finally:
+                tenant.reset_state_classifier()
+                tenant.scheduler.wake_now(['agent_api_url'])
         elif 'default' in request.form:
-            agent_data['alert_times'] = {
-                "Over Lunch": 60,
-                "Over Break": 15,
-                "Personal": 0,
-                "IT Issues": 0,
-                "Long Call": 7,
-                "ACW": 2,
-                "Unresponsible": 0,
-                "Unavailable": 0
-            }
+            tenant.agent_data['alert_times'] = dict(DEFAULT_ALERT_TIMES)
+            tenant.reset_state_classifier()
+            tenant.scheduler.wake_now(['agent_api_url'])
             return redirect(url_for('settings', message='Default times restored successfully!', message_type='success'))
     
-    return render_template_string('''
-        <!DOCTYPE html>
-        <html lang="en">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>Alert Settings</title>
-            <style>
-                body {
-                    font-family: Arial, sans-serif;
-                    background-color: #F6F0FF;
-                    margin: 0;
-                    padding: 0;
-                }
-                .container {
-                    max-width: 500px;
-                    margin: 0 auto;
-                    padding: 20px;
-                    background-color: white;
-                    border-radius: 10px;
-                    box-shadow: 0 0 20px rgba(0, 0, 0, 0.1);
-                    margin-top: 20px;
-                    margin-bottom: 20px;
-                }
-                h1 {
-                    text-align: center;
-                    color: black;
-                    margin-bottom: 20px;
-                }
-                .form-group {
-                    margin-bottom: 15px;
-                }
-                label {
-                    display: block;
-                    margin-bottom: 5px;
-                    font-weight: bold;
-                }
-                input {
-                    width: 100%;
-                    padding: 8px;
-                    border: 1px solid #ddd;
-                    border-radius: 4px;
-                    box-sizing: border-box;
-                }
-                .button-container {
-                    display: flex;
-                    justify-content: space-between;
-                    margin-top: 20px;
-                }
-                .btn {
-                    background-color: #6A0DAD;
-                    color: white;
-                    border: none;
-                    padding: 10px 20px;
-                    font-size: 16px;
-                    border-radius: 5px;
-                    cursor: pointer;
-                    font-weight: bold;
-                }
-                .btn:hover {
-                    background-color: #5a0b9d;
-                }
-                .message {
-                    margin-bottom: 20px;
-                    padding: 10px;
-                    border-radius: 5px;
-                    text-align: center;
-                }
-                .error {
-                    background-color: #ffebee;
-                    color: #d32f2f;
-                }
-                .success {
-                    background-color: #e8f5e9;
-                    color: #2e7d32;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>Alert Settings</h1>
-                
-                {% if message %}
-                <div class="message {{ message_type }}">{{ message }}</div>
-                {% endif %}
-                
-                <form method="POST">
-                    {% for alert, time in alert_times.items() %}
-                    <div class="form-group">
-                        <label for="{{ alert }}">{{ alert }} (minutes):</label>
-                        <input type="number" id="{{ alert }}" name="{{ alert }}" value="{{ time }}" min="0">
-                    </div>
-                    {% endfor %}
-                    
-                    <div class="button-container">
-                        <button type="submit" name="apply" class="btn">Apply</button>
-                        <button type="submit" name="default" class="btn">Use Default Times</button>
-                    </div>
-                </form>
-            </div>
-        </body>
-        </html>
-    ''', alert_times=agent_data['alert_times'], 
+    return render_template('settings.html', alert_times=tenant.agent_data['alert_times'], 
     message=request.args.get('message'), 
     message_type=request.args.get('message_type', 'error'))
 
 @app.route('/change_token')
 def change_token():
     """Change token route"""
-    agent_data['token'] = None
+    current_tenant().agent_data['token'] = None
     return redirect(url_for('login'))
 
+@app.route('/stream')
+@token_required
+def stream():
+    """Server-Sent Events stream pushing the full snapshot on connect, then the changes of each newly published generation"""
+    tenant = current_tenant()
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    last_generation = int(last_event_id) if last_event_id.isdigit() else None
+    
+    def events(last_generation):
+        while tenant.agent_data['token']:
+            snapshot = wait_for_snapshot(tenant, last_generation, SSE_KEEPALIVE)
+            if snapshot.generation == last_generation:
+                yield ": keep-alive\n\n"
+                continue
+            message = snapshot_sse_message(tenant, snapshot, last_generation)
+            last_generation = snapshot.generation
+            yield message
+    
+    response = Response(stream_with_context(events(last_generation)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/data/delta')
+@token_required
+def api_data_delta():
+    """Changes since the client's last seen generation (?since=N), or a full snapshot to resync"""
+    since = request.args.get('since', '')
+    since = int(since) if since.isdigit() else None
+    snapshot = get_snapshot()
+    response = Response(delta_response_body(current_tenant(), snapshot, since), mimetype='application/json')
+    return compress_response(response, snapshot.generation)
+
 @app.route('/api/data')
 @token_required
+@conditional_on_generation
 def api_data():
     """API endpoint to get current data (for potential future AJAX updates)"""
+    snapshot = get_snapshot()
+    return jsonify({
+        'generation': snapshot.generation,
+        'queue_data': dict(snapshot.queue_data),
+        'agent_counter_data': dict(snapshot.agent_counter_data),
+        'has_queue_calls': snapshot.has_queue_calls,
+        'alert_count': len(snapshot.alert_list),
+        'last_update': datetime.fromtimestamp(snapshot.published_at).strftime("%I:%M:%S %p"),
+        'module_age': module_ages(snapshot),
+        'no_data_since': no_data_since(snapshot)
+    })
+
+@app.route('/api/agents')
+@token_required
+@conditional_on_generation
+def api_agents():
+    """One page of agents (?list=, default all) filtered by ?state=, ?alert= and ?name= prefix, sorted by ?sort=[-]duration|start_time"""
+    snapshot = get_snapshot()
+    list_name = request.args.get('list', 'agents')
+    if list_name not in AGENT_QUERY_LISTS:
+        return jsonify({'error': f"list must be one of {', '.join(AGENT_QUERY_LISTS)}"}), 400
+    sort = request.args.get('sort') or None
+    descending = sort is not None and sort.startswith('-')
+    if sort is not None:
+        sort = sort.lstrip('-')
+        if sort not in ('duration', 'start_time'):
+            return jsonify({'error': 'sort must be duration or start_time, prefixed with - for descending'}), 400
+    try:
+        page = int(request.args.get('page', 1))
+        limit = int(request.args.get('limit', AGENT_PAGE_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'page and limit must be integers'}), 400
+    if page < 1 or not 1 <= limit <= MAX_AGENT_PAGE_LIMIT:
+        return jsonify({'error': f"page must be at least 1 and limit between 1 and {MAX_AGENT_PAGE_LIMIT}"}), 400
+    
+    rows = ()
+    if snapshot.agent_index is not None:
+        rows = snapshot.agent_index.query(
+            view=None if list_name == 'agents' else getattr(snapshot, list_name),
+            states=request.args.getlist('state'),
+            alerts=request.args.getlist('alert'),
+            name_prefix=request.args.get('name', ''),
+            sort=sort,
+            descending=descending
+        )
+    start = (page - 1) * limit
+    return jsonify({
+        'generation': snapshot.generation,
+        'agent_fields': AgentRow._fields,
+        'total': len(rows),
+        'page': page,
+        'limit': limit,
+        'pages': (len(rows) + limit - 1) // limit,
+        'agents': [list(snapshot.agents[index]) for index in rows[start:start + limit]]
+    })
+
+@app.route('/api/trends')
+@token_required
+def api_trends():
+    """Lists the metrics available in the trend history"""
+    tenant = current_tenant()
+    return jsonify({
+        'metrics': tenant.metric_history.metrics(),
+        'kpi_names': {f"kpi_{metric_id}": name for metric_id, name in tenant.kpi_mapping.items()},
+        'window_seconds': HISTORY_WINDOW,
+        'resolution_seconds': HISTORY_RESOLUTION
+    })
+
+@app.route('/api/trends/<metric>')
+@token_required
+@conditional_on_generation
+def api_trend(metric):
+    """History of one metric over the last ?minutes= (default 60), averaged into ?step= second buckets"""
+    try:
+        minutes = float(request.args.get('minutes', 60))
+        step = float(request.args.get('step', HISTORY_RESOLUTION))
+    except ValueError:
+        return jsonify({'error': 'minutes and step must be numbers'}), 400
+    if step <= 0:
+        return jsonify({'error': 'step must be positive'}), 400
+    
+    metric_history = current_tenant().metric_history
+    end = get_snapshot().published_at
+    start = end - minutes * 60
+    if step <= HISTORY_RESOLUTION:
+        points = metric_history.range(metric, start, end)
+    else:
+        points = metric_history.downsample(metric, start, end, step)
+    return jsonify({
+        'metric': metric,
+        'start': start,
+        'end': end,
+        'step': max(step, HISTORY_RESOLUTION),
+        'points': [[timestamp, None if value != value else value] for timestamp, value in points]
+    })
+
+def day_range(date_str):
+    """Returns (start, end) epoch seconds for a local YYYY-MM-DD day, default today"""
+    if date_str:
+        day = datetime.strptime(date_str, "%Y-%m-%d")
+    else:
+        day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = int(day.timestamp())
+    return start, start + 86400
+
+@app.route('/api/history/<source>/<metric>')
+@token_required
+def api_history(source, metric):
+    """Stored samples of a queue metric or KPI id for one day (?date=YYYY-MM-DD), at ?resolution=raw|1m|15m"""
+    history_store = current_tenant().history_store
+    if not history_store:
+        return jsonify({'error': 'History is disabled'}), 404
+    tables = {'queue': 'queue_samples', 'kpi': 'kpi_samples'}
+    resolution = request.args.get('resolution', '1m')
+    if source not in tables or (resolution != 'raw' and resolution not in ROLLUP_RESOLUTIONS):
+        return jsonify({'error': 'Unknown history source or resolution'}), 404
+    try:
+        start, end = day_range(request.args.get('date'))
+    except ValueError:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    
+    rows = history_store.samples(tables[source], metric, start, end, resolution)
     return jsonify({
-        'queue_data': agent_data['queue_data'],
-        'agent_counter_data': agent_data['agent_counter_data'],
-        'has_queue_calls': agent_data['has_queue_calls'],
-        'alert_count': len(agent_data['alert_list']),
-        'last_update': datetime.now().strftime("%I:%M:%S %p")
+        'source': source,
+        'metric': metric,
+        'resolution': resolution,
+        'start': start,
+        'end': end,
+        'points': [list(row) for row in rows]
     })
 
+@app.route('/api/history/intervals')
+@token_required
+def api_history_intervals():
+    """Agent state intervals for one day (?date=YYYY-MM-DD), optionally for one ?agent="""
+    history_store = current_tenant().history_store
+    if not history_store:
+        return jsonify({'error': 'History is disabled'}), 404
+    try:
+        start, end = day_range(request.args.get('date'))
+    except ValueError:
+        return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+    
+    rows = history_store.intervals(start, end, request.args.get('agent'))
+    return jsonify({
+        'start': start,
+        'end': end,
+        'intervals': [
+            {'agent': agent, 'state': state, 'start': start_ts, 'end': end_ts}
+            for agent, state, start_ts, end_ts in rows
+        ]
+    })
+
+@app.route('/api/state_totals')
+@token_required
+def api_state_totals():
+    """Seconds each agent (or ?agent=) has spent in each state today"""
+    return jsonify(current_tenant().state_tracker.agent_totals(time.time(), request.args.get('agent')))
+
+@app.route('/api/state_changes')
+@token_required
+def api_state_changes():
+    """Recent agent state changes that ended after ?since= (epoch seconds)"""
+    try:
+        since = float(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': 'since must be a number'}), 400
+    return jsonify([change._asdict() for change in current_tenant().state_tracker.changes_since(since)])
+
+@app.route('/api/refresh', methods=['POST'])
+@token_required
+def api_refresh():
+    """Fetches all modules (or the ?module= ones) right away instead of waiting for their schedule"""
+    modules = request.args.getlist('module') or None
+    if modules and any(module not in MODULE_PARAMS for module in modules):
+        return jsonify({'error': 'Unknown module'}), 400
+    current_tenant().scheduler.wake_now(modules)
+    return jsonify({'status': 'scheduled', 'modules': modules or list(MODULE_PARAMS)}), 202
+
+@app.route('/api/stats')
+@token_required
+def api_stats():
+    """Fetch, connection and cache statistics of the current tenant, and the shared connection pool"""
+    tenant = current_tenant()
+    return jsonify({
+        'tenant': tenant.id,
+        'tenants': {
+            other.id: {
+                'name': other.name,
+                'has_token': bool(other.agent_data['token']),
+                'generation': other.snapshot.generation
+            }
+            for other in tenants.values()
+        },
+        'fetch_metrics': tenant.fetch_metrics,
+        'connection_stats': get_connection_stats(),
+        'durations': get_duration_stats(),
+        'page_cache': tenant.page_cache.stats(),
+        'compression': dict(compression_summary(), cache=tenant.compressed_cache.stats()),
+        'poll_schedule': tenant.scheduler.schedule(),
+        'modules': module_health(tenant, get_snapshot(), time.time()),
+        'history': tenant.history_store.stats if tenant.history_store else None
+    })
+
+@app.route('/api/profile', methods=['GET', 'POST', 'DELETE'])
+@token_required
+def api_profile():
+    """Starts (POST ?seconds=&interval=), stops (DELETE) or reports on the sampling profiler"""
+    if request.method == 'POST':
+        try:
+            seconds = float(request.args.get('seconds', 30))
+            interval = float(request.args.get('interval', PROFILE_INTERVAL))
+        except ValueError:
+            return jsonify({'error': 'seconds and interval must be numbers'}), 400
+        if seconds <= 0 or interval <= 0:
+            return jsonify({'error': 'seconds and interval must be positive'}), 400
+        if not profiler.start(seconds, interval):
+            return jsonify({'error': 'A profile is already running', 'profile': profiler.status()}), 409
+        return jsonify(profiler.status()), 202
+    if request.method == 'DELETE':
+        profiler.stop()
+    return jsonify(profiler.status())
+
+@app.route('/api/profile/collapsed')
+@token_required
+def api_profile_collapsed():
+    """Stacks counted by the last or current profile, in the collapsed format flame graph tools read"""
+    return Response(profiler.collapsed(), mimetype='text/plain')
+
+@app.route('/metrics')
+def metrics():
+    """Fetch, cycle stage and route timings of every tenant in the Prometheus text format"""
+    now = time.time()
+    lines = list(timing_metrics.prometheus_lines())
+    endpoint_stats = [
+        (tenant, key, stats)
+        for tenant in tenants.values()
+        for key, stats in sorted(tenant.fetch_metrics['endpoints'].items())
+    ]
+    lines += prometheus_metric('sla_monitor_fetches_total', 'counter', "Module fetches attempted", [
+        ([('tenant', tenant.id), ('module', key)], stats['count']) for tenant, key, stats in endpoint_stats
+    ])
+    lines += prometheus_metric('sla_monitor_fetch_errors_total', 'counter', "Module fetches that failed", [
+        ([('tenant', tenant.id), ('module', key)], stats['errors']) for tenant, key, stats in endpoint_stats
+    ])
+    lines += prometheus_metric('sla_monitor_fetch_timeouts_total', 'counter', "Module fetches that missed the cycle deadline", [
+        ([('tenant', tenant.id), ('module', key)], stats['timeouts']) for tenant, key, stats in endpoint_stats
+    ])
+    lines += prometheus_metric('sla_monitor_cycles_total', 'counter', "Update cycles run", [
+        ([('tenant', tenant.id)], tenant.fetch_metrics['cycles']) for tenant in tenants.values()
+    ])
+    lines += prometheus_metric('sla_monitor_last_cycle_seconds', 'gauge', "Wall time of the last update cycle", [
+        ([('tenant', tenant.id)], timing_metrics.last('sla_monitor_cycle_seconds', (tenant.id,))) for tenant in tenants.values()
+    ])
+    lines += prometheus_metric('sla_monitor_data_age_seconds', 'gauge', "Seconds since a module last brought good data", [
+        ([('tenant', tenant.id), ('module', key)], now - updated_at)
+        for tenant in tenants.values()
+        for key, updated_at in sorted(tenant.snapshot.module_updated_at.items())
+    ])
+    compression = compression_summary()
+    lines += prometheus_metric('sla_monitor_compression_identity_bytes_total', 'counter', "Response bytes before compression", [
+        ([], compression['identity_bytes'])
+    ])
+    lines += prometheus_metric('sla_monitor_compression_sent_bytes_total', 'counter', "Response bytes sent after compression", [
+        ([], compression['sent_bytes'])
+    ])
+    durations = get_duration_stats()
+    lines += prometheus_metric('sla_monitor_malformed_durations_total', 'counter', "Agent durations that could not be parsed, counted when parsed rather than when served from the cache", [
+        ([], durations['malformed'])
+    ])
+    lines += prometheus_metric('sla_monitor_duration_cache_hits_total', 'counter', "Agent durations served from the parse cache", [
+        ([], durations['cache']['hits'])
+    ])
+    lines += prometheus_metric('sla_monitor_duration_cache_misses_total', 'counter', "Agent durations parsed", [
+        ([], durations['cache']['misses'])
+    ])
+    lines += prometheus_metric('sla_monitor_snapshot_generation', 'gauge', "Generation of the latest published snapshot", [
+        ([('tenant', tenant.id)], tenant.snapshot.generation) for tenant in tenants.values()
+    ])
+    return Response('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
\ No newline at end of file
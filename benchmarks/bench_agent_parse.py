@@ -0,0 +1,81 @@
+"""Benchmark for decoding the currentagentstates payload.
+
+Compares a full response.json() decode followed by AgentRow extraction with the
+streaming parser that walks data.RowValues as the body arrives, reporting time
+and peak traced memory per cycle at 1k, 10k and 50k agents.
+
+    python benchmarks/bench_agent_parse.py
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('HISTORY_DB', '')
+
+import ServerGNC
+from payloads import make_agent_payload
+
+ROW_COUNTS = [1000, 10000, 50000]
+REPEATS = 5
+
+class BodyResponse:
+    """Stands in for a streamed requests response over an in-memory body"""
+    
+    encoding = None
+    
+    def __init__(self, body):
+        self.body = body
+    
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+def full_decode(body):
+    """What fetch_data and process_agent_module do: read the whole body, json(), then extract"""
+    response = BodyResponse(body)
+    content = b''.join(response.iter_content(ServerGNC.STREAM_CHUNK_SIZE))
+    data = json.loads(content)
+    return ServerGNC.agent_rows(data["data"]["RowValues"])
+
+def stream_decode(body):
+    """The streaming path used by fetch_agent_states"""
+    response = BodyResponse(body)
+    return ServerGNC.parse_agent_states(ServerGNC.response_text_chunks(response))["data"]["RowValues"]
+
+def best_time(func, *args):
+    """Returns the fastest of REPEATS runs in seconds"""
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def peak_memory(func, *args):
+    """Returns the peak traced allocation of one run in bytes"""
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def main():
+    print(f"{'agents':>8} {'body KB':>8} {'json() ms':>10} {'stream ms':>10} {'json() peak KB':>15} {'stream peak KB':>15} {'peak ratio':>11}")
+    for count in ROW_COUNTS:
+        body = json.dumps(make_agent_payload(count)).encode('utf-8')
+        if full_decode(body) != stream_decode(body):
+            raise SystemExit(f"Parser mismatch at {count} agents")
+        
+        full = best_time(full_decode, body)
+        stream = best_time(stream_decode, body)
+        full_peak = peak_memory(full_decode, body)
+        stream_peak = peak_memory(stream_decode, body)
+        print(f"{count:>8} {len(body) / 1024:>8.0f} {full * 1e3:>10.1f} {stream * 1e3:>10.1f} "
+              f"{full_peak / 1024:>15.0f} {stream_peak / 1024:>15.0f} {full_peak / stream_peak:>10.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Micro-benchmark for per-agent state classification.
+
+Compares the original if/elif substring chain with the compiled StateClassifier
+loop and, when NumPy is installed, the vectorized path at 1k, 10k and 100k agents,
+and checks they all produce identical agent lists.
+
+    python benchmarks/bench_classification.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('HISTORY_DB', '')
+
+import ServerGNC
+from payloads import make_agent_payload
+
+ROW_COUNTS = [1000, 10000, 100000]
+REPEATS = 5
+
+def legacy_time_to_seconds(time_str):
+    """The duration parser as it was before memoization"""
+    try:
+        h, m, s = map(int, time_str.split(':'))
+        return h * 3600 + m * 60 + s
+    except (ValueError, AttributeError):
+        return 0
+
+def legacy_process_agent_module(agent_api_data, alert_times):
+    """The classification loop as it was before the rule engine"""
+    alert_list, aux_list, chat_agents, available_agents, on_call_agents = [], [], [], [], []
+    for agent in agent_api_data["data"]["RowValues"]:
+        name = agent.get("Group", {}).get("groupName", "Unknown")
+        duration = agent.get("Duration", "00:00:00")
+        state = agent.get("State", {}).get("DisplayState", "Unknown")
+        start_time = agent.get("StartTime", "Unknown")
+        duration_sec = legacy_time_to_seconds(duration)
+        
+        alert = ""
+        if "Meal" in state and duration_sec > (alert_times["Over Lunch"] * 60):
+            alert = "Over Lunch"
+        elif "Break" in state and duration_sec > (alert_times["Over Break"] * 60):
+            alert = "Over Break"
+        elif "Personal" in state and duration_sec >= (alert_times["Personal"] * 60):
+            alert = "Personal"
+        elif "IT" in state and duration_sec >= (alert_times["IT Issues"] * 60):
+            alert = "IT Issues"
+        elif ("In-call" in state or "On Call" in state) and duration_sec > (alert_times["Long Call"] * 60):
+            alert = "Long Call"
+        elif "ACW" in state and duration_sec > (alert_times["ACW"] * 60):
+            alert = "ACW"
+        elif "Unresponsive" in state and duration_sec > (alert_times["Unresponsible"] * 60):
+            alert = "Unresponsive"
+        elif "Unavailable" in state and duration_sec > (alert_times["Unavailable"] * 60):
+            alert = "Unavailable"
+        
+        if alert:
+            alert_list.append((alert, name, duration, state))
+        if state not in ["Available", "On Call", "Chat", "In-call"]:
+            aux_list.append((state, name, duration, start_time))
+        if "Chat" in state:
+            chat_agents.append((name, state, duration, start_time))
+        elif state == "Available":
+            available_agents.append((name, state, duration, start_time))
+        elif state == "On Call" or state == "In-call":
+            on_call_agents.append((name, state, duration, start_time))
+    
+    return {
+        'alert_list': tuple(alert_list),
+        'aux_list': tuple(aux_list),
+        'chat_agents': tuple(chat_agents),
+        'available_agents': tuple(available_agents),
+        'on_call_agents': tuple(on_call_agents)
+    }
+
+def legacy_shape(lists):
+    """Converts AgentRow views back to the tuples the legacy loop builds, for comparison"""
+    return {
+        'alert_list': tuple((agent.alert, agent.name, agent.duration, agent.state) for agent in lists['alert_list']),
+        'aux_list': tuple((agent.state, agent.name, agent.duration, agent.start_time) for agent in lists['aux_list']),
+        'chat_agents': tuple((agent.name, agent.state, agent.duration, agent.start_time) for agent in lists['chat_agents']),
+        'available_agents': tuple((agent.name, agent.state, agent.duration, agent.start_time) for agent in lists['available_agents']),
+        'on_call_agents': tuple((agent.name, agent.state, agent.duration, agent.start_time) for agent in lists['on_call_agents'])
+    }
+
+def best_time(func, *args):
+    """Returns the fastest of REPEATS runs in seconds"""
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    alert_times = ServerGNC.DEFAULT_ALERT_TIMES
+    vectorized = ServerGNC.np is not None
+    header = f"{'agents':>8} {'legacy ns/agent':>16} {'engine ns/agent':>16} {'speedup':>8}"
+    if vectorized:
+        header += f" {'numpy ns/agent':>15} {'speedup':>8}"
+    print(header)
+    
+    for count in ROW_COUNTS:
+        payload = make_agent_payload(count)
+        # The engine takes AgentRows, as the fetch hands them over
+        agents = ServerGNC.agent_rows(payload["data"]["RowValues"])
+        classifier = ServerGNC.StateClassifier(alert_times)
+        
+        expected = legacy_process_agent_module(payload, alert_times)
+        if legacy_shape(ServerGNC.classify_agents_loop(agents, classifier)) != expected:
+            raise SystemExit(f"Rule engine mismatch at {count} agents")
+        if vectorized and legacy_shape(ServerGNC.classify_agents_vectorized(agents, classifier)) != expected:
+            raise SystemExit(f"Vectorized mismatch at {count} agents")
+        
+        legacy = best_time(legacy_process_agent_module, payload, alert_times)
+        engine = best_time(ServerGNC.classify_agents_loop, agents, classifier)
+        line = f"{count:>8} {legacy / count * 1e9:>16.0f} {engine / count * 1e9:>16.0f} {legacy / engine:>7.2f}x"
+        if vectorized:
+            batch = best_time(ServerGNC.classify_agents_vectorized, agents, classifier)
+            line += f" {batch / count * 1e9:>15.0f} {legacy / batch:>7.2f}x"
+        print(line)
+
+if __name__ == '__main__':
+    main()
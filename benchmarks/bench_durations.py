@@ -0,0 +1,69 @@
+"""Benchmark for agent duration parsing.
+
+Replays the Duration column of a synthetic floor over consecutive 10 s cycles
+(each agent's duration advances between cycles, as in the live payload) and
+compares the original split/map parser with the memoized time_to_seconds.
+
+    python benchmarks/bench_durations.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('HISTORY_DB', '')
+
+import ServerGNC
+from payloads import make_agent_rows
+
+AGENT_COUNTS = [1000, 10000]
+CYCLES = 30
+
+def legacy_time_to_seconds(time_str):
+    """The parser as it was before the memoized version"""
+    try:
+        h, m, s = map(int, time_str.split(':'))
+        return h * 3600 + m * 60 + s
+    except (ValueError, AttributeError):
+        return 0
+
+def cycle_durations(count):
+    """Returns one list of duration strings per cycle"""
+    base = [ServerGNC.time_to_seconds(row["Duration"]) for row in make_agent_rows(count)]
+    cycles = []
+    for cycle in range(CYCLES):
+        cycles.append([
+            "%02d:%02d:%02d" % (s // 3600, s % 3600 // 60, s % 60)
+            for s in (seconds + cycle * 10 for seconds in base)
+        ])
+    return cycles
+
+def run(parser, cycles):
+    """Parses every cycle and returns the total time in seconds"""
+    start = time.perf_counter()
+    for durations in cycles:
+        for duration in durations:
+            parser(duration)
+    return time.perf_counter() - start
+
+def main():
+    print(f"{'agents':>8} {'cycles':>7} {'legacy ns/value':>16} {'cached ns/value':>16} {'speedup':>8} {'hit rate':>9}")
+    for count in AGENT_COUNTS:
+        cycles = cycle_durations(count)
+        values = count * CYCLES
+        
+        for durations in cycles:
+            for duration in durations:
+                if legacy_time_to_seconds(duration) != ServerGNC.time_to_seconds(duration):
+                    raise SystemExit(f"Parser mismatch for {duration!r}")
+        
+        ServerGNC._cached_parse_duration.cache_clear()
+        legacy = run(legacy_time_to_seconds, cycles)
+        cached = run(ServerGNC.time_to_seconds, cycles)
+        info = ServerGNC._cached_parse_duration.cache_info()
+        hit_rate = info.hits / max(info.hits + info.misses, 1)
+        print(f"{count:>8} {CYCLES:>7} {legacy / values * 1e9:>16.0f} {cached / values * 1e9:>16.0f} "
+              f"{legacy / cached:>7.2f}x {hit_rate:>8.1%}")
+
+if __name__ == '__main__':
+    main()
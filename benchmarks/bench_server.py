@@ -0,0 +1,286 @@
+"""End-to-end benchmark of the update cycle and the routes against a stub UJET.
+
+Starts benchmarks/stub_ujet.py in its own process, points a "bench" tenant at it
+and serves the app on a local port. For each agent count it runs update cycles
+back to back while a separate load process requests the pages and APIs from
+concurrent clients, then reports cycle time, route p50/p99 latency, server CPU
+and resident memory. Results are compared against benchmarks/baseline.json, and
+the run exits non-zero when a figure regresses beyond the tolerance.
+
+    python benchmarks/bench_server.py
+    python benchmarks/bench_server.py --agents 1000,20000 --latency currentagentstates=0.3
+    python benchmarks/bench_server.py --save-baseline
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+import requests
+
+from stub_ujet import parse_latency, run_stub
+
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline.json')
+
+# Requested round-robin by every client
+ROUTES = [
+    '/dashboard',
+    '/alerts',
+    '/aux',
+    '/queue',
+    '/agent_states',
+    '/kpis',
+    '/api/data',
+    '/api/data/delta?since=0',
+    '/api/stats'
+]
+
+# Module ids of the stub endpoints, the stub ignores them
+STUB_ENDPOINTS = {
+    'agent_api_url': 'currentagentstates/bench-agents',
+    'queue_api_url': 'queueCounter/bench-queue',
+    'agent_counter_api_url': 'agentCounterData/bench-counter',
+    'kpi_config_api_url': 'metricreview/bench-kpi-config',
+    'kpi_data_api_url': 'metricreview/bench-kpi'
+}
+
+# Differences below these are noise, whatever the relative change
+MIN_REGRESSION_MS = 2.0
+MIN_REGRESSION_MB = 5.0
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+def rss_mb():
+    """Current resident set size in MB, the peak when /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    """Peak resident set size in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+def generate_load(base_url, routes, clients, ready, stop, results):
+    """Load process: clients request the routes in turn until stop is set, then sends the latencies"""
+    latencies = {route: [] for route in routes}
+    errors = {route: 0 for route in routes}
+    
+    def client(offset):
+        session = requests.Session()
+        i = offset
+        while not stop.is_set():
+            route = routes[i % len(routes)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                response = session.get(base_url + route, allow_redirects=False, timeout=30, stream=True)
+                # Time to the last byte; decompressing in this process would be measured as server latency
+                response.raw.read(decode_content=False)
+                response.close()
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            # list.append is atomic, the clients can share the lists
+            if ok:
+                latencies[route].append(elapsed)
+            else:
+                errors[route] += 1
+    
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        ready.set()
+        for offset in range(clients):
+            pool.submit(client, offset)
+    results.send({'latencies': latencies, 'errors': errors})
+
+def run_phase(ServerGNC, tenant, stub_url, base_url, agents, args):
+    """Runs the cycles for one agent count under client load and returns its figures"""
+    requests.post(stub_url + '/stub/config', json={'agents': agents}, timeout=30).raise_for_status()
+    # Warm up the payload bodies, duration cache and page templates
+    for _ in range(2):
+        ServerGNC.update_agent_data(tenant)
+    
+    context = multiprocessing.get_context('spawn')
+    ready, stop = context.Event(), context.Event()
+    receiver, sender = context.Pipe(duplex=False)
+    load = context.Process(target=generate_load, args=(base_url, ROUTES, args.clients, ready, stop, sender), daemon=True)
+    load.start()
+    ready.wait()
+    
+    cycle_times = []
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for _ in range(args.cycles):
+        start = time.perf_counter()
+        ServerGNC.update_agent_data(tenant)
+        cycle_times.append(time.perf_counter() - start)
+        if args.cycle_interval:
+            time.sleep(args.cycle_interval)
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    
+    stop.set()
+    load_results = receiver.recv()
+    load.join()
+    
+    routes = {}
+    for route in ROUTES:
+        latencies = load_results['latencies'][route]
+        routes[route] = {
+            'requests': len(latencies),
+            'errors': load_results['errors'][route],
+            'p50_ms': round(percentile(latencies, 0.5) * 1e3, 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 0.99) * 1e3, 2) if latencies else None
+        }
+    return {
+        'cycle_p50_ms': round(percentile(cycle_times, 0.5) * 1e3, 2),
+        'cycle_p99_ms': round(percentile(cycle_times, 0.99) * 1e3, 2),
+        'cpu_percent': round(cpu / wall * 100, 1),
+        'requests_per_s': round(sum(route['requests'] for route in routes.values()) / wall, 1),
+        'rss_mb': round(rss_mb(), 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'routes': routes
+    }
+
+def print_results(results):
+    """Prints the cycle and route figures of each agent count"""
+    print(f"{'agents':>8} {'cycle p50 ms':>13} {'cycle p99 ms':>13} {'cpu %':>7} {'req/s':>8} {'rss MB':>8} {'peak MB':>8}")
+    for agents, result in results.items():
+        print(f"{agents:>8} {result['cycle_p50_ms']:>13.1f} {result['cycle_p99_ms']:>13.1f} {result['cpu_percent']:>7.1f} "
+              f"{result['requests_per_s']:>8.1f} {result['rss_mb']:>8.1f} {result['peak_rss_mb']:>8.1f}")
+    print()
+    print(f"{'agents':>8} {'route':<26} {'requests':>9} {'errors':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for agents, result in results.items():
+        for route, stats in result['routes'].items():
+            p50 = f"{stats['p50_ms']:.1f}" if stats['p50_ms'] is not None else '-'
+            p99 = f"{stats['p99_ms']:.1f}" if stats['p99_ms'] is not None else '-'
+            print(f"{agents:>8} {route:<26} {stats['requests']:>9} {stats['errors']:>7} {p50:>8} {p99:>8}")
+
+def compared_figures(result):
+    """Yields (name, value, noise floor) of the figures checked against the baseline"""
+    for name in ['cycle_p50_ms', 'cycle_p99_ms']:
+        yield name, result[name], MIN_REGRESSION_MS
+    yield 'rss_mb', result['rss_mb'], MIN_REGRESSION_MB
+    for route, stats in result['routes'].items():
+        yield f"{route} p50_ms", stats['p50_ms'], MIN_REGRESSION_MS
+        yield f"{route} p99_ms", stats['p99_ms'], MIN_REGRESSION_MS
+
+def find_regressions(baseline, results, tolerance):
+    """Returns a line per figure that got worse than the baseline by more than the tolerance"""
+    regressions = []
+    for agents, result in results.items():
+        previous = baseline['results'].get(agents)
+        if previous is None:
+            continue
+        previous_figures = {name: value for name, value, _ in compared_figures(previous)}
+        for name, value, floor in compared_figures(result):
+            before = previous_figures.get(name)
+            if value is None or before is None:
+                continue
+            if value > before * (1 + tolerance) and value - before > floor:
+                regressions.append(f"{agents} agents {name}: {before} -> {value} (+{(value / before - 1) * 100:.0f}%)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--agents', default='1000,10000', help="comma-separated agent counts")
+    parser.add_argument('--cycles', type=int, default=20, help="update cycles per agent count")
+    parser.add_argument('--cycle-interval', type=float, default=0.25, help="pause between cycles, in seconds")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent route clients")
+    parser.add_argument('--latency', action='append', default=[], metavar='[MODULE=]SECONDS',
+                        help="stub response delay, for every module or one; repeatable")
+    parser.add_argument('--payload-dir', help="directory of recorded <module>.json responses for the stub")
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="allowed relative slowdown before failing")
+    args = parser.parse_args()
+    agent_counts = [int(count) for count in args.agents.split(',')]
+    config = {
+        'agents': agent_counts,
+        'cycles': args.cycles,
+        'cycle_interval': args.cycle_interval,
+        'clients': args.clients,
+        'latency': parse_latency(args.latency),
+        'payload_dir': bool(args.payload_dir)
+    }
+    
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    stub = context.Process(target=run_stub, args=(0, agent_counts[0], config['latency'], args.payload_dir, sender), daemon=True)
+    stub.start()
+    stub_url = f"http://127.0.0.1:{receiver.recv()}"
+    
+    # The tenant has no token in the file, so the background updater leaves it alone
+    # and the cycles measured below are the only ones
+    tenants_file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump([{
+        'id': 'bench',
+        'name': 'Benchmark',
+        'endpoints': {key: f"{stub_url}/api/v2/dashboards/modules/{path}" for key, path in STUB_ENDPOINTS.items()}
+    }], tenants_file)
+    tenants_file.close()
+    os.environ['TENANTS_FILE'] = tenants_file.name
+    os.environ.setdefault('HISTORY_DB', '')
+    
+    import ServerGNC
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+    
+    tenant = ServerGNC.tenants['bench']
+    tenant.agent_data['token'] = 'bench-token'
+    server = make_server('127.0.0.1', 0, ServerGNC.app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    
+    results = {}
+    try:
+        for agents in agent_counts:
+            results[str(agents)] = run_phase(ServerGNC, tenant, stub_url, base_url, agents, args)
+    finally:
+        server.shutdown()
+        stub.terminate()
+        os.unlink(tenants_file.name)
+    print_results(results)
+    
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2)
+            f.write('\n')
+        print(f"\nBaseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}, run with --save-baseline to record one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['config'] != json.loads(json.dumps(config)):
+        print(f"\nBaseline was recorded with {baseline['config']}, not comparing")
+        return
+    regressions = find_regressions(baseline, results, args.tolerance)
+    if regressions:
+        print(f"\nRegressions beyond {args.tolerance:.0%} of the baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        raise SystemExit(1)
+    print(f"\nNo regressions beyond {args.tolerance:.0%} of the baseline")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Synthetic UJET dashboard payloads shaped like the real module responses"""
+import random
+
+# DisplayState values seen on the floor, weighted roughly like a normal shift
+DISPLAY_STATES = [
+    ("Available", 20),
+    ("On Call", 25),
+    ("In-call", 10),
+    ("Chat", 8),
+    ("Chat - Multiple", 2),
+    ("ACW", 8),
+    ("Meal", 5),
+    ("Break", 6),
+    ("Personal", 2),
+    ("IT Issue", 1),
+    ("Unresponsive", 1),
+    ("Unavailable", 3),
+    ("Training", 3),
+    ("Coaching", 2),
+    ("Meeting", 2),
+    ("Outbound", 2)
+]
+
+def make_duration(rng):
+    """Returns an HH:MM:SS duration, mostly short with a long tail"""
+    seconds = int(rng.expovariate(1 / 420))
+    return "%02d:%02d:%02d" % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+def make_agent_rows(count, seed=0):
+    """Returns a list of currentagentstates RowValues entries"""
+    rng = random.Random(seed)
+    states = [state for state, _ in DISPLAY_STATES]
+    weights = [weight for _, weight in DISPLAY_STATES]
+    rows = []
+    for i in range(count):
+        state = rng.choices(states, weights)[0]
+        rows.append({
+            "Group": {"groupName": f"Agent {i:05d}", "groupId": 100000 + i, "teamName": f"Team {i % 40}"},
+            "Duration": make_duration(rng),
+            "State": {"DisplayState": state, "StateCode": states.index(state), "Color": "#6A0DAD"},
+            "StartTime": "%02d:%02d %s" % (rng.randint(1, 12), rng.randint(0, 59), rng.choice(["AM", "PM"])),
+            "Skills": ["Inbound", "Chat", "Callback"],
+            "Extension": str(4000 + i)
+        })
+    return rows
+
+def make_agent_payload(count, seed=0):
+    """Returns a full currentagentstates module response"""
+    return {"status": "success", "data": {"RowValues": make_agent_rows(count, seed)}}
+
+# metricreview MetricIDs the service maps to KPI names
+KPI_METRIC_IDS = [7398, 7412, 11587, 7416, 7396, 7402, 11235, 11245, 134099]
+
+def make_queue_payload(seed=0):
+    """Returns a queueCounter module response"""
+    rng = random.Random(seed)
+    in_queue = rng.choice([0, 0, 0, 1, 2, 5])
+    return {"status": "success", "data": {
+        "BothInQueue": in_queue,
+        "LongestQueueTimeBoth": make_duration(rng) if in_queue else "00:00:00",
+        "CallbacksInQueue": rng.randint(0, 3),
+        "TotalAgents": rng.randint(50, 500)
+    }}
+
+def make_agent_counter_payload(count, seed=0):
+    """Returns an agentCounterData module response for count agents"""
+    rng = random.Random(seed)
+    available = rng.randint(0, count // 4)
+    inbound = rng.randint(0, count // 3)
+    return {"status": "success", "data": {
+        "Total": count,
+        "Available": available,
+        "Unavailable": count - available - inbound,
+        "Inbound": inbound,
+        "Outbound": rng.randint(0, 10),
+        "Acw": rng.randint(0, count // 10),
+        "Waiting": 0,
+        "Preview": 0,
+        "Dialer": 0
+    }}
+
+def make_kpi_payload(seed=0):
+    """Returns a metricreview module response covering the mapped KPIs"""
+    rng = random.Random(seed)
+    metrics = []
+    for metric_id in KPI_METRIC_IDS:
+        value = round(rng.uniform(0, 100), 2)
+        metrics.append({
+            "Metric": {"MetricID": metric_id},
+            "Today": {"MetricValue": value, "MetricDisplayValue": f"{value:.2f}"}
+        })
+    return {"status": "success", "data": {"Metrics": metrics}}
@@ -0,0 +1,154 @@
+"""Local stand-in for the UJET dashboard API.
+
+Serves the currentagentstates, queueCounter, agentCounterData and metricreview
+modules under /api/v2/dashboards/modules/<module>/<id>, either from recorded
+responses (<module>.json in --payload-dir) or from the synthetic payloads, after
+a configurable latency. The agent count and latencies can be changed while it
+runs with a POST of {"agents": ..., "latency": {...}} to /stub/config.
+
+    python benchmarks/stub_ujet.py --port 8001 --agents 5000 --latency 0.2 --latency currentagentstates=0.8
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from payloads import make_agent_counter_payload, make_agent_payload, make_kpi_payload, make_queue_payload
+
+MODULES = ['currentagentstates', 'queueCounter', 'agentCounterData', 'metricreview']
+MODULE_PATH = '/api/v2/dashboards/modules/'
+
+# Synthetic agent payloads are rotated so consecutive cycles see agents change state
+AGENT_VARIANTS = 4
+
+class StubState:
+    """Payloads and latencies served by the stub, shared by its handler threads"""
+    
+    def __init__(self, agents, latency=None, payload_dir=None):
+        self.lock = threading.Lock()
+        self.agents = agents
+        self.latency = dict(latency or {})
+        self.recorded = {}
+        if payload_dir:
+            for module in MODULES:
+                path = os.path.join(payload_dir, f"{module}.json")
+                if os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        self.recorded[module] = f.read()
+        self.agent_bodies = {}
+        self.requests = dict.fromkeys(MODULES, 0)
+    
+    def configure(self, config):
+        """Applies a /stub/config body"""
+        with self.lock:
+            if 'agents' in config:
+                self.agents = int(config['agents'])
+            self.latency.update(config.get('latency', {}))
+    
+    def delay(self, module):
+        """Seconds to wait before answering for a module, '*' being the default"""
+        return float(self.latency.get(module, self.latency.get('*', 0)))
+    
+    def body(self, module):
+        """Returns the encoded response for a module"""
+        with self.lock:
+            count = self.requests[module]
+            self.requests[module] += 1
+            agents = self.agents
+            if module in self.recorded:
+                return self.recorded[module]
+            if module == 'currentagentstates':
+                # Built once per agent count, encoding tens of thousands of rows per request would dominate
+                bodies = self.agent_bodies.get(agents)
+                if bodies is None:
+                    bodies = self.agent_bodies[agents] = [
+                        json.dumps(make_agent_payload(agents, seed)).encode('utf-8')
+                        for seed in range(AGENT_VARIANTS)
+                    ]
+                return bodies[count % AGENT_VARIANTS]
+        if module == 'queueCounter':
+            payload = make_queue_payload(count)
+        elif module == 'agentCounterData':
+            payload = make_agent_counter_payload(agents, count)
+        else:
+            payload = make_kpi_payload(count)
+        return json.dumps(payload).encode('utf-8')
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/stub/stats':
+            with self.server.state.lock:
+                return self.send_body(json.dumps(self.server.state.requests).encode('utf-8'))
+        if not path.startswith(MODULE_PATH):
+            return self.send_error(404)
+        module = path[len(MODULE_PATH):].split('/', 1)[0]
+        if module not in MODULES:
+            return self.send_error(404)
+        delay = self.server.state.delay(module)
+        if delay:
+            time.sleep(delay)
+        self.send_body(self.server.state.body(module))
+    
+    def do_POST(self):
+        if self.path != '/stub/config':
+            return self.send_error(404)
+        length = int(self.headers.get('Content-Length', 0))
+        self.server.state.configure(json.loads(self.rfile.read(length) or b'{}'))
+        self.send_body(b'{"status": "ok"}')
+    
+    def send_body(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+def make_stub_server(port=0, agents=1000, latency=None, payload_dir=None):
+    """Returns an unstarted stub server on 127.0.0.1 (port 0 picks a free one)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(agents, latency, payload_dir)
+    return server
+
+def run_stub(port, agents, latency, payload_dir, ready):
+    """Serves forever, sending the bound port through ready (a multiprocessing connection) once listening"""
+    server = make_stub_server(port, agents, latency, payload_dir)
+    ready.send(server.server_port)
+    server.serve_forever()
+
+def parse_latency(values):
+    """Turns ['0.2', 'currentagentstates=0.8'] into {'*': 0.2, 'currentagentstates': 0.8}"""
+    latency = {}
+    for value in values:
+        module, _, seconds = value.rpartition('=')
+        if module and module not in MODULES:
+            raise argparse.ArgumentTypeError(f"Unknown module {module!r}")
+        latency[module or '*'] = float(seconds)
+    return latency
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--agents', type=int, default=1000, help="agents in the synthetic currentagentstates payload")
+    parser.add_argument('--latency', action='append', default=[], metavar='[MODULE=]SECONDS',
+                        help="response delay, for every module or one; repeatable")
+    parser.add_argument('--payload-dir', help="directory of recorded <module>.json responses to replay")
+    args = parser.parse_args()
+    
+    server = make_stub_server(args.port, args.agents, parse_latency(args.latency), args.payload_dir)
+    print(f"Stub UJET serving {', '.join(MODULES)} on http://127.0.0.1:{server.server_port}{MODULE_PATH}<module>/<id>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
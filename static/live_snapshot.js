@@ -0,0 +1,95 @@
+// Follows the /stream Server-Sent Events. The first message holds the full
+// snapshot and later ones the deltas of each new generation, which are applied
+// to a local copy; onSnapshot gets that copy after every message.
+
+// Agent lists hold [name, ...] rows, deltas upsert and remove them by name. Rows
+// that entered are inserted at their position in the new list, unless the whole
+// name order is sent because rows that stayed moved.
+function applyListDelta(rows, changes) {
+    var removed = {};
+    changes.remove.forEach(function(name) {
+        removed[name] = true;
+    });
+    var upserts = {};
+    changes.upsert.forEach(function(row) {
+        upserts[row[0]] = row;
+    });
+    var result = [];
+    rows.forEach(function(row) {
+        var name = row[0];
+        if (!removed[name]) {
+            result.push(upserts[name] || row);
+        }
+    });
+    if (changes.order) {
+        var byName = {};
+        result.forEach(function(row) {
+            byName[row[0]] = row;
+        });
+        return changes.order.map(function(name) {
+            return upserts[name] || byName[name];
+        });
+    }
+    Object.keys(changes.insert_at).sort(function(a, b) {
+        return changes.insert_at[a] - changes.insert_at[b];
+    }).forEach(function(name) {
+        result.splice(changes.insert_at[name], 0, upserts[name]);
+    });
+    return result;
+}
+
+// Changed keys, with null for removed ones
+function applyDictDelta(values, changes) {
+    Object.keys(changes).forEach(function(key) {
+        if (changes[key] === null) {
+            delete values[key];
+        } else {
+            values[key] = changes[key];
+        }
+    });
+}
+
+function applyDelta(snapshot, delta) {
+    Object.keys(delta.lists).forEach(function(name) {
+        snapshot[name] = applyListDelta(snapshot[name], delta.lists[name]);
+    });
+    Object.keys(delta.fields).forEach(function(field) {
+        if (field === 'has_queue_calls') {
+            snapshot.has_queue_calls = delta.fields.has_queue_calls;
+        } else {
+            applyDictDelta(snapshot[field], delta.fields[field]);
+        }
+    });
+    snapshot.generation = delta.generation;
+    snapshot.published_at = delta.published_at;
+}
+
+function moduleAges(snapshot) {
+    // Same as the server's module_ages, for the modules that have data
+    var ages = {};
+    Object.keys(snapshot.module_age).forEach(function(key) {
+        var updatedAt = snapshot.module_updated_at[key];
+        ages[key] = updatedAt === undefined ? null : Math.round(snapshot.published_at - updatedAt);
+    });
+    return ages;
+}
+
+function followSnapshots(onSnapshot) {
+    var snapshot = null;
+    var source = new EventSource('/stream');
+    source.addEventListener('delta', function(event) {
+        var message = JSON.parse(event.data);
+        if (message.full) {
+            snapshot = message.snapshot;
+        } else if (snapshot) {
+            message.deltas.forEach(function(delta) {
+                applyDelta(snapshot, delta);
+            });
+            snapshot.module_age = moduleAges(snapshot);
+        } else {
+            return;
+        }
+        onSnapshot(snapshot);
+    });
+    return source;
+}
@@ -0,0 +1,31 @@
+// Stale data notice shared by the pages that apply live snapshots. The stale
+// thresholds come from the notice's data-stale-after attribute.
+var staleAfter = JSON.parse(document.getElementById('stale-notice').dataset.staleAfter || '{}');
+
+function applyStaleNotice(data, modules) {
+    // A module whose data expired and was cleared wins over one that is only old
+    var expiredAt = null;
+    var age = null;
+    modules.forEach(function(key) {
+        var moduleExpiredAt = (data.module_expired_at || {})[key];
+        if (moduleExpiredAt !== undefined && (expiredAt === null || moduleExpiredAt < expiredAt)) {
+            expiredAt = moduleExpiredAt;
+        }
+        // Oldest module on this page whose data is past its stale threshold
+        var moduleAge = data.module_age[key];
+        if (moduleAge !== null && moduleAge > staleAfter[key] && (age === null || moduleAge > age)) {
+            age = moduleAge;
+        }
+    });
+    if (expiredAt !== null) {
+        age = Math.round(data.published_at - expiredAt);
+    }
+    var notice = document.getElementById('stale-notice');
+    notice.style.display = age === null ? 'none' : 'block';
+    notice.classList.toggle('expired', expiredAt !== null);
+    if (age !== null) {
+        document.getElementById('stale-label').textContent = expiredAt !== null ? 'No data since' : 'Showing last known data from';
+        document.getElementById('stale-since').textContent = new Date((data.published_at - age) * 1000).toLocaleTimeString();
+        document.getElementById('stale-age').textContent = age;
+    }
+}